@@ -0,0 +1,656 @@
+# Benchmarks for the ingestion pipeline. They run against a synthetic openFDA
+# partition unless --zip points at a real one, and need no API keys.
+#
+# Compare label preprocessing before and after the vectorized Document builder:
+# python benchmark.py preprocess --labels 20000
+#
+# Compare embedded volume of the section-aware chunker against the old splitter:
+# python benchmark.py chunking --labels 20000
+#
+# Embed through a local fake server that throttles, and check nothing is lost:
+# python benchmark.py throttling --texts 5000 --max-rps 20 --error-rate 0.05
+#
+# Compare quantization settings on memory, latency and recall@4 (needs a Qdrant server).
+# Memory is the change in the server's resident memory across each load (or in
+# this process's with --qdrant-url :memory:), so use a server with nothing else on it:
+# python benchmark.py quantization --qdrant-url http://localhost:6333 --points 100000
+#
+# Compare embedding sizes on recall@4, latency and memory. Vectors come from
+# the local embedding cache (real text-embedding-3 vectors) when --cache is
+# given; shortened vectors are the leading dimensions renormalized, which is
+# what the API returns for a smaller `dimensions`. Synthetic vectors spread
+# information evenly over all dimensions, so their recall is a pessimistic bound:
+# python benchmark.py dimensions --cache embedding_cache.sqlite3 --dimensions 256 512 1536
+#
+# Compare the local vector index (local_index.py), exact and IVF at several
+# nprobe, against Qdrant on recall@4 and per-query latency. In-memory Qdrant
+# searches by brute force in Python; pass a server URL to compare against HNSW:
+# python benchmark.py local --qdrant-url http://localhost:6333 --points 100000 --nprobe 4 16 64
+#
+# Time BM25 searches of the lexical index at full-corpus size, on synthetic
+# chunks whose words follow a Zipf distribution like label text:
+# python benchmark.py lexical --chunks 1000000
+#
+# Run the whole indexing pipeline (download, parse, split, deduplicate, embed,
+# upsert) offline against the fake embeddings server and an in-process Qdrant,
+# reporting per-stage time, chunks/sec, upsert throughput and peak RSS. In CI,
+# --json saves the report and --min-chunks-per-sec fails the run on a regression:
+# python benchmark.py ingest --labels 1000 --latency 0.05 --json ingest.json --min-chunks-per-sec 50
+# Add --no-dedup to see how much of the peak RSS deduplication accounts for.
+# Local-mode Qdrant scans every point on filtered deletes, so the "delete stale"
+# stage is far slower here than against a server with payload indexes. Compare
+# the bulk upload path against per-batch upserts on a scratch Qdrant server:
+# python benchmark.py ingest --labels 5000 --latency 0 --qdrant-url http://localhost:6333 --bulk-load
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import sys
+import time
+import zipfile
+from fda_labels import METADATA_FIELDS, TEXT_FIELDS, SectionChunker, iter_label_sections, iter_label_chunks
+
+WORDS = ("tablet dose patient renal hepatic risk hypoglycemia nausea pregnancy infection "
+         "hypertension mg daily therapy adverse reaction contraindicated warfarin insulin").split()
+
+
+def write_synthetic_partition(path, num_labels, seed=0):
+    """Write a zipped openFDA-style drug label file with `num_labels` labels."""
+    rng = random.Random(seed)
+
+    def paragraph(num_words):
+        return ' '.join(rng.choice(WORDS) for _ in range(num_words))
+
+    results = []
+    for i in range(num_labels):
+        label = {field: [paragraph(rng.randint(20, 400))] for field in TEXT_FIELDS if rng.random() < 0.9}
+        label["id"] = f"label-{i}"
+        label["openfda"] = {
+            "brand_name": [f"Brand{i % 500}"],
+            "generic_name": [f"GENERIC{i % 300}"],
+            "manufacturer_name": [f"Manufacturer {i % 50}"],
+            "product_type": ["HUMAN PRESCRIPTION DRUG"],
+            "route": ["ORAL"],
+            "substance_name": [f"SUBSTANCE{i % 300}"],
+            "rxcui": [str(100000 + i)],
+            "spl_id": [f"spl-{i}"],
+            "package_ndc": [f"{i}-{j}" for j in range(rng.randint(1, 8))],
+        }
+        results.append(label)
+
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+        zip_file.writestr("drug-label.json", json.dumps({"meta": {}, "results": results}))
+
+
+def baseline_documents(zip_path):
+    """The original preprocessing: json.load, json_normalize, row-wise apply and a per-row metadata loop."""
+    import pandas as pd
+    from langchain_community.document_loaders import DataFrameLoader
+
+    zip_file = zipfile.ZipFile(zip_path)
+    json_file = zip_file.open(zip_file.namelist()[0])
+    data = json.load(json_file)
+    df = pd.json_normalize(data['results'])
+    for field in TEXT_FIELDS + METADATA_FIELDS:
+        if field not in df:
+            df[field] = None
+
+    df[TEXT_FIELDS] = df[TEXT_FIELDS].fillna('')
+    df['content'] = df[TEXT_FIELDS].apply(lambda x: ' '.join(x.astype(str)), axis=1)
+    loader = DataFrameLoader(df, page_content_column='content')
+    drug_docs = loader.load()
+    for doc, row in zip(drug_docs, df.to_dict(orient='records')):
+        metadata = {}
+        for field in METADATA_FIELDS:
+            value = row.get(field)
+            if isinstance(value, list):
+                value = ', '.join(str(v) for v in value if pd.notna(v))
+            elif pd.isna(value):
+                value = 'Not Available'
+            metadata[field] = value
+        doc.metadata = metadata
+    return drug_docs
+
+
+def benchmark_preprocess(args):
+    zip_path = args.zip
+    if zip_path is None:
+        zip_path = io.BytesIO()
+        write_synthetic_partition(zip_path, args.labels)
+
+    start_time = time.perf_counter()
+    before = baseline_documents(zip_path)
+    before_time = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    after = list(iter_label_sections(zip_path))
+    after_time = time.perf_counter() - start_time
+
+    print(f"Labels: {len(after)}")
+    print(f"Before (json_normalize + apply + DataFrameLoader): {before_time:.2f} s")
+    print(f"After (streaming + vectorized builder):           {after_time:.2f} s")
+    print(f"Speedup: {before_time / max(after_time, 1e-9):.2f}x")
+    assert len(before) == len(after)
+
+
+def benchmark_chunking(args):
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+    zip_path = args.zip
+    if zip_path is None:
+        zip_path = io.BytesIO()
+        write_synthetic_partition(zip_path, args.labels)
+    labels = list(iter_label_sections(zip_path))
+
+    # The old splitter ran over all sections concatenated with spaces
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
+    before = [chunk for _, sections in labels for chunk in text_splitter.split_text(' '.join(text for _, text in sections))]
+    after = [chunk.page_content for chunk in iter_label_chunks(labels, SectionChunker())]
+
+    before_chars = sum(len(chunk) for chunk in before)
+    after_chars = sum(len(chunk) for chunk in after)
+    print(f"Labels: {len(labels)}")
+    print(f"Before (RecursiveCharacterTextSplitter, overlap 100): {len(before)} chunks, {before_chars} characters embedded")
+    print(f"After (SectionChunker):                              {len(after)} chunks, {after_chars} characters embedded")
+    print(f"Embedded characters: {100 * (after_chars - before_chars) / max(before_chars, 1):+.1f}%")
+
+
+def benchmark_throttling(args):
+    from embeddings import EmbeddingClient
+    from fake_embeddings_server import FakeEmbeddingsServer
+
+    server = FakeEmbeddingsServer(("127.0.0.1", 0), dimensions=args.dimensions, latency=args.latency,
+                                  max_rps=args.max_rps, error_rate=args.error_rate, retry_after=1)
+    server.start_in_thread()
+    texts = [f"chunk {i}" for i in range(args.texts)]
+
+    async def run():
+        client = EmbeddingClient("fake-key", "fake-model", url=server.url, batch_size=args.batch_size,
+                                 max_concurrency=args.concurrency)
+        try:
+            start_time = time.perf_counter()
+            vectors = await client.embed_documents(texts)
+            return vectors, time.perf_counter() - start_time, client
+        finally:
+            await client.aclose()
+
+    vectors, elapsed, client = asyncio.run(run())
+    server.shutdown()
+
+    lost = sum(vector is None for vector in vectors)
+    print(f"Texts: {len(texts)}, lost: {lost}")
+    print(f"Time: {elapsed:.2f} s ({len(texts) / elapsed:.1f} chunks/sec)")
+    print(f"Server: {server.stats}")
+    print(f"Client: {client.retries} retries, {client.throttled} throttled, "
+          f"final concurrency limit {client.limiter.limit:.1f} / {client.max_concurrency}")
+
+
+def synthetic_vectors(count, dimensions, clusters=200, seed=0):
+    """Unit vectors drawn around random centroids, so nearest neighbours are not trivial."""
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    centroids = rng.standard_normal((clusters, dimensions)).astype(np.float32)
+    vectors = centroids[rng.integers(0, clusters, count)] + 0.6 * rng.standard_normal((count, dimensions)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def resident_memory_mb(qdrant_url):
+    """Resident memory of the Qdrant server, or of this process when Qdrant runs in it (None if unknown).
+
+    A server reports its allocator's resident bytes in /metrics; pages of
+    memory-mapped on-disk vectors are left out, as the OS can drop them.
+    """
+    import gc
+    import httpx
+
+    if qdrant_url == ":memory:":
+        gc.collect()
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+    response = httpx.get(f"{qdrant_url.rstrip('/')}/metrics", timeout=10)
+    response.raise_for_status()
+    for line in response.text.splitlines():
+        if line.startswith("memory_resident_bytes "):
+            return float(line.split()[1]) / 1e6
+    return None
+
+
+def memory_change(before, after):
+    if before is None or after is None:
+        return "RAM not reported"
+    return f"{after - before:+.0f} MB RAM"
+
+
+def benchmark_quantization(args):
+    import numpy as np
+    from qdrant_client import QdrantClient
+    from qdrant_client.http import models
+    from collection import hnsw_config, quantization_config, search_params, vectors_config
+
+    client = QdrantClient(location=args.qdrant_url) if args.qdrant_url == ":memory:" else QdrantClient(url=args.qdrant_url)
+    vectors = synthetic_vectors(args.points, args.dimensions)
+    queries = synthetic_vectors(args.queries, args.dimensions, seed=1)
+    configs = [
+        {"name": "float32 in RAM (baseline)", "quantization": "none", "on_disk": False},
+        {"name": "scalar int8, originals on disk", "quantization": "scalar", "on_disk": True},
+        {"name": "binary, originals on disk", "quantization": "binary", "on_disk": True},
+    ]
+
+    exact = None
+    for config in configs:
+        collection_name = f"benchmark_{config['quantization']}"
+        if client.collection_exists(collection_name):
+            client.delete_collection(collection_name)
+        memory_before = resident_memory_mb(args.qdrant_url)
+        client.create_collection(
+            collection_name=collection_name,
+            vectors_config=vectors_config(size=args.dimensions, on_disk=config["on_disk"]),
+            hnsw_config=hnsw_config(m=args.m, ef_construct=args.ef_construct),
+            quantization_config=quantization_config(config["quantization"]),
+        )
+        client.upload_collection(collection_name, vectors=vectors, ids=list(range(args.points)), batch_size=512, wait=True)
+        while client.get_collection(collection_name).status != models.CollectionStatus.GREEN:
+            time.sleep(1)
+        memory = memory_change(memory_before, resident_memory_mb(args.qdrant_url))
+
+        if exact is None:
+            # Ground truth for recall: exact (brute force) search over the unquantized vectors
+            exact = [{point.id for point in client.search(collection_name, query.tolist(), limit=4,
+                                                           search_params=models.SearchParams(exact=True))}
+                     for query in queries]
+
+        params = search_params(config["quantization"] != "none", oversampling=args.oversampling)
+        latencies = []
+        hits = 0
+        for query, truth in zip(queries, exact):
+            start_time = time.perf_counter()
+            result = client.search(collection_name, query.tolist(), limit=4, search_params=params)
+            latencies.append(time.perf_counter() - start_time)
+            hits += len(truth & {point.id for point in result})
+
+        latencies_ms = np.array(latencies) * 1000
+        print(f"{config['name']}: {memory}, "
+              f"latency p50 {np.percentile(latencies_ms, 50):.2f} ms / p95 {np.percentile(latencies_ms, 95):.2f} ms, "
+              f"recall@4 {hits / (4 * len(queries)):.3f}")
+        client.delete_collection(collection_name)
+
+
+def cached_vectors(cache_path, count, dimensions=1536):
+    """Up to `count` full-size vectors from an EmbeddingCache database."""
+    import sqlite3
+    import numpy as np
+
+    conn = sqlite3.connect(cache_path)
+    rows = conn.execute("SELECT vector FROM embeddings WHERE length(vector) = ? LIMIT ?", (dimensions * 4, count))
+    vectors = np.array([np.frombuffer(row[0], dtype=np.float32) for row in rows])
+    conn.close()
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def shorten_vectors(vectors, dimensions):
+    """Keep the leading `dimensions` components and renormalize, like text-embedding-3 `dimensions`."""
+    import numpy as np
+
+    shortened = vectors[:, :dimensions]
+    return shortened / np.linalg.norm(shortened, axis=1, keepdims=True)
+
+
+def benchmark_dimensions(args):
+    import numpy as np
+    from qdrant_client import QdrantClient
+    from qdrant_client.http import models
+    from collection import hnsw_config, search_params, vectors_config
+
+    client = QdrantClient(location=args.qdrant_url) if args.qdrant_url == ":memory:" else QdrantClient(url=args.qdrant_url)
+    full_size = max(args.dimensions)
+    if args.cache:
+        vectors = cached_vectors(args.cache, args.points + args.queries, full_size)
+        if len(vectors) <= args.queries:
+            sys.exit(f"{args.cache} holds only {len(vectors)} vectors of size {full_size}")
+        # Held-out cached vectors serve as queries
+        vectors, queries = vectors[args.queries:], vectors[:args.queries]
+    else:
+        vectors = synthetic_vectors(args.points, full_size)
+        queries = synthetic_vectors(args.queries, full_size, seed=1)
+    points = len(vectors)
+
+    # Ground truth: exact nearest neighbours of the full-size vectors
+    similarities = queries @ vectors.T
+    truth = [set(np.argsort(-row)[:4].tolist()) for row in similarities]
+
+    for dimensions in sorted(args.dimensions):
+        collection_name = f"benchmark_dimensions_{dimensions}"
+        if client.collection_exists(collection_name):
+            client.delete_collection(collection_name)
+        memory_before = resident_memory_mb(args.qdrant_url)
+        client.create_collection(
+            collection_name=collection_name,
+            vectors_config=vectors_config(size=dimensions, on_disk=False),
+            hnsw_config=hnsw_config(m=args.m),
+        )
+        client.upload_collection(collection_name, vectors=shorten_vectors(vectors, dimensions),
+                                 ids=list(range(points)), batch_size=512, wait=True)
+        while client.get_collection(collection_name).status != models.CollectionStatus.GREEN:
+            time.sleep(1)
+        memory = memory_change(memory_before, resident_memory_mb(args.qdrant_url))
+
+        latencies = []
+        hits = 0
+        for query, query_truth in zip(shorten_vectors(queries, dimensions), truth):
+            start_time = time.perf_counter()
+            result = client.search(collection_name, query.tolist(), limit=4, search_params=search_params(False))
+            latencies.append(time.perf_counter() - start_time)
+            hits += len(query_truth & {point.id for point in result})
+
+        latencies_ms = np.array(latencies) * 1000
+        print(f"{dimensions} dimensions: {memory}, "
+              f"latency p50 {np.percentile(latencies_ms, 50):.2f} ms / p95 {np.percentile(latencies_ms, 95):.2f} ms, "
+              f"recall@4 vs {full_size} dimensions {hits / (4 * len(queries)):.3f}")
+        client.delete_collection(collection_name)
+
+
+def benchmark_local(args):
+    import tempfile
+    import numpy as np
+    from qdrant_client import QdrantClient
+    from qdrant_client.http import models
+    from collection import hnsw_config, search_params, vectors_config
+    from local_index import LocalVectorIndex
+
+    if args.cache:
+        vectors = cached_vectors(args.cache, args.points + args.queries, args.dimensions)
+        if len(vectors) <= args.queries:
+            sys.exit(f"{args.cache} holds only {len(vectors)} vectors of size {args.dimensions}")
+        vectors, queries = vectors[args.queries:], vectors[:args.queries]
+    else:
+        vectors = synthetic_vectors(args.points, args.dimensions)
+        queries = synthetic_vectors(args.queries, args.dimensions, seed=1)
+    points = len(vectors)
+
+    # Ground truth: exact nearest neighbours
+    truth = [set(np.argsort(-row)[:4].tolist()) for row in queries @ vectors.T]
+
+    def report(name, search):
+        latencies = []
+        hits = 0
+        for query, query_truth in zip(queries, truth):
+            start_time = time.perf_counter()
+            found = search(query)
+            latencies.append(time.perf_counter() - start_time)
+            hits += len(query_truth & set(found))
+        latencies_ms = np.array(latencies) * 1000
+        print(f"{name}: latency p50 {np.percentile(latencies_ms, 50):.3f} ms / p95 {np.percentile(latencies_ms, 95):.3f} ms, "
+              f"recall@4 {hits / (4 * len(queries)):.3f}")
+
+    client = QdrantClient(location=args.qdrant_url) if args.qdrant_url == ":memory:" else QdrantClient(url=args.qdrant_url)
+    collection_name = "benchmark_local"
+    if client.collection_exists(collection_name):
+        client.delete_collection(collection_name)
+    client.create_collection(collection_name=collection_name,
+                             vectors_config=vectors_config(size=args.dimensions, on_disk=False),
+                             hnsw_config=hnsw_config(m=args.m))
+    client.upload_collection(collection_name, vectors=vectors, ids=list(range(points)), batch_size=512, wait=True)
+    while client.get_collection(collection_name).status != models.CollectionStatus.GREEN:
+        time.sleep(1)
+    report(f"Qdrant ({args.qdrant_url})",
+           lambda query: [point.id for point in client.search(collection_name, query.tolist(), limit=4,
+                                                              search_params=search_params(False))])
+    client.delete_collection(collection_name)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        index = LocalVectorIndex(tmp)
+        start_time = time.perf_counter()
+        for start in range(0, points, 10000):
+            rows = range(start, min(start + 10000, points))
+            index.add(vectors[start:start + 10000], [("", {}) for _ in rows])
+        print(f"Local index: wrote {points} vectors in {time.perf_counter() - start_time:.1f}s")
+        report("Local exact", lambda query: index.search(query, 4)[1][0].tolist())
+
+        start_time = time.perf_counter()
+        index.build_ivf(lists=args.lists)
+        print(f"Local IVF: built {len(index.ivf['centroids'])} lists in {time.perf_counter() - start_time:.1f}s")
+        for nprobe in args.nprobe:
+            index.nprobe = nprobe
+            report(f"Local IVF, nprobe {nprobe}", lambda query: index.search(query, 4)[1][0].tolist())
+        index.close()
+
+
+def benchmark_lexical(args):
+    import sqlite3
+    import tempfile
+    import numpy as np
+    from lexical_index import LexicalIndex
+
+    rng = np.random.default_rng(0)
+    vocabulary = np.array([f"term{i}" for i in range(args.vocabulary)])
+    weights = 1 / np.arange(1, args.vocabulary + 1)
+    weights /= weights.sum()
+    names = [f"drug{i}" for i in range(args.drugs)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "lexical.sqlite3")
+        index = LexicalIndex(path)
+        start_time = time.perf_counter()
+        for start in range(0, args.chunks, 10000):
+            count = min(10000, args.chunks - start)
+            words = vocabulary[rng.choice(args.vocabulary, size=(count, args.words), p=weights)]
+            drugs = rng.integers(0, args.drugs, count)
+            index.add_many(range(start, start + count), [" ".join(row) for row in words],
+                           [[names[drug]] for drug in drugs])
+        size_mb = sum(os.path.getsize(file) for file in (path, path + "-wal") if os.path.exists(file)) / 1e6
+        print(f"Indexed {args.chunks} chunks in {time.perf_counter() - start_time:.1f}s ({size_mb:.0f} MB)")
+
+        def report(label, searches):
+            latencies = []
+            for query, query_names in searches:
+                start_time = time.perf_counter()
+                index.search(query, args.k, names=query_names)
+                latencies.append(time.perf_counter() - start_time)
+            latencies_ms = np.array(latencies) * 1000
+            print(f"{label}: p50 {np.percentile(latencies_ms, 50):.2f} ms / p95 {np.percentile(latencies_ms, 95):.2f} ms")
+
+        conn = sqlite3.connect(path)
+        document_counts = dict(conn.execute("SELECT term, doc FROM chunk_vocab WHERE term LIKE 'term%'"))
+        conn.close()
+        def term_in(count):
+            return max((term for term in document_counts if document_counts[term] <= count), key=document_counts.get)
+
+        # Terms in more chunks than this are not searched, so the cost of a term stops growing there
+        for term in (term_in(0.001 * args.chunks), term_in(min(index.max_df_ratio * args.chunks, index.max_df))):
+            report(f"One term in {document_counts[term]} chunks", [(term, None)] * args.queries)
+            report(f"One term in {document_counts[term]} chunks, within one drug",
+                   [(term, [names[rng.integers(args.drugs)]]) for _ in range(args.queries)])
+        questions = [" ".join(vocabulary[rng.choice(args.vocabulary, 4, p=weights)]) for _ in range(args.queries)]
+        report("Four-term questions", [(question, None) for question in questions])
+        report("Four-term questions within one drug",
+               [(question, [names[rng.integers(args.drugs)]]) for question in questions])
+        index.close()
+
+
+def benchmark_ingest(args):
+    import resource
+    import tempfile
+    import threading
+    from functools import partial
+    from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+    from qdrant_client import AsyncQdrantClient, QdrantClient
+    import main as indexer
+    from checkpoint import IndexingCheckpoint
+    from downloads import DownloadCache
+    from embeddings import EmbeddingClient
+    from fake_embeddings_server import FakeEmbeddingsServer
+    from jobs import IndexingJob
+    from lexical_index import LexicalIndex
+
+    class QuietHandler(SimpleHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+    if args.bulk_load and not args.qdrant_url:
+        sys.exit("--bulk-load uploads through a second client, so it needs a Qdrant server (--qdrant-url)")
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        zip_path = args.zip
+        if zip_path is None:
+            zip_path = os.path.join(work_dir, "drug-label-benchmark.json.zip")
+            write_synthetic_partition(zip_path, args.labels)
+
+        # The partition is served over HTTP so the download stage is part of the run
+        file_server = ThreadingHTTPServer(("127.0.0.1", 0),
+                                          partial(QuietHandler, directory=os.path.dirname(os.path.abspath(zip_path))))
+        file_server.daemon_threads = True
+        embeddings_server = FakeEmbeddingsServer(("127.0.0.1", 0), latency=args.latency)
+        threading.Thread(target=file_server.serve_forever, daemon=True).start()
+        embeddings_server.start_in_thread()
+        url = f"http://127.0.0.1:{file_server.server_address[1]}/{os.path.basename(zip_path)}"
+
+        async def run():
+            if args.qdrant_url:
+                indexer.client = AsyncQdrantClient(url=args.qdrant_url, prefer_grpc=indexer.QDRANT_PREFER_GRPC)
+                indexer.bulk_client = QdrantClient(url=args.qdrant_url, prefer_grpc=indexer.QDRANT_PREFER_GRPC)
+            elif args.qdrant_path:
+                indexer.client = AsyncQdrantClient(path=args.qdrant_path)
+            else:
+                indexer.client = AsyncQdrantClient(location=":memory:")
+            indexer.checkpoint = IndexingCheckpoint(os.path.join(work_dir, "checkpoint.sqlite3"))
+            indexer.download_cache = DownloadCache(os.path.join(work_dir, "downloads"))
+            if args.lexical:
+                indexer.lexical_index = LexicalIndex(os.path.join(work_dir, "lexical.sqlite3"))
+            if args.no_dedup:
+                indexer.DEDUPLICATE_CHUNKS = False
+            indexer.embedding_client = EmbeddingClient("fake-key", "fake-model", url=embeddings_server.url,
+                                                       batch_size=args.batch_size, max_concurrency=args.concurrency,
+                                                       dimensions=indexer.EMBEDDING_DIMENSIONS)
+            job = IndexingJob("benchmark", {"url": url})
+            job.started_at = time.time()
+            try:
+                await indexer.run_index_partition(job, url, bulk_load=args.bulk_load)
+            finally:
+                job.finished_at = time.time()
+                await indexer.embedding_client.aclose()
+                indexer.checkpoint.close()
+                if indexer.lexical_index is not None:
+                    indexer.lexical_index.close()
+            return job
+
+        job = asyncio.run(run())
+        file_server.shutdown()
+        embeddings_server.shutdown()
+
+    stats = job.to_dict()
+    upsert_seconds = job.stage_seconds.get("upsert", 0.0)
+    report = {
+        "chunks": job.processed,
+        "indexed": job.indexed,
+        "elapsed_seconds": stats["elapsed_seconds"],
+        "chunks_per_sec": stats["chunks_per_sec"],
+        "stage_seconds": stats["stage_seconds"],
+        "upsert_points_per_sec": round(job.upserted / upsert_seconds, 2) if upsert_seconds else None,
+        # ru_maxrss is in kilobytes on Linux; it includes the in-process fake servers
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "embedding_requests": embeddings_server.stats["requests"],
+    }
+
+    print(f"Chunks: {report['chunks']} ({report['indexed']} indexed)")
+    print(f"Total: {report['elapsed_seconds']:.2f} s, {report['chunks_per_sec']:.1f} chunks/sec")
+    print("Stage busy time (summed over workers):")
+    for stage, seconds in report["stage_seconds"].items():
+        print(f"  {stage:<18} {seconds:8.2f} s")
+    print(f"Upsert throughput: {report['upsert_points_per_sec']} points/sec")
+    print(f"Peak RSS: {report['peak_rss_mb']} MB")
+
+    if args.json:
+        with open(args.json, 'w') as json_file:
+            json.dump(report, json_file, indent=2)
+    if args.min_chunks_per_sec and report["chunks_per_sec"] < args.min_chunks_per_sec:
+        sys.exit(f"Regression: {report['chunks_per_sec']:.1f} chunks/sec is below {args.min_chunks_per_sec}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingestion pipeline benchmarks")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    preprocess = subparsers.add_parser("preprocess", help="Label-to-Document preprocessing time per partition")
+    preprocess.add_argument("--zip", help="Zipped openFDA partition to use instead of synthetic data")
+    preprocess.add_argument("--labels", type=int, default=20000, help="Labels in the synthetic partition")
+    preprocess.set_defaults(func=benchmark_preprocess)
+
+    chunking = subparsers.add_parser("chunking", help="Chunks and embedded characters per partition")
+    chunking.add_argument("--zip", help="Zipped openFDA partition to use instead of synthetic data")
+    chunking.add_argument("--labels", type=int, default=20000, help="Labels in the synthetic partition")
+    chunking.set_defaults(func=benchmark_chunking)
+
+    throttling = subparsers.add_parser("throttling", help="Embedding client against a throttling fake server")
+    throttling.add_argument("--texts", type=int, default=5000)
+    throttling.add_argument("--batch-size", type=int, default=64)
+    throttling.add_argument("--concurrency", type=int, default=16)
+    throttling.add_argument("--dimensions", type=int, default=256)
+    throttling.add_argument("--latency", type=float, default=0.05)
+    throttling.add_argument("--max-rps", type=int, default=20)
+    throttling.add_argument("--error-rate", type=float, default=0.05)
+    throttling.set_defaults(func=benchmark_throttling)
+
+    quantization = subparsers.add_parser("quantization", help="Memory, latency and recall@4 per quantization setting")
+    quantization.add_argument("--qdrant-url", default="http://localhost:6333", help="Qdrant server (or :memory:)")
+    quantization.add_argument("--points", type=int, default=100000)
+    quantization.add_argument("--queries", type=int, default=200)
+    quantization.add_argument("--dimensions", type=int, default=1536)
+    quantization.add_argument("--m", type=int, default=16)
+    quantization.add_argument("--ef-construct", type=int, default=100)
+    quantization.add_argument("--oversampling", type=float, default=2.0)
+    quantization.set_defaults(func=benchmark_quantization)
+
+    dimensions = subparsers.add_parser("dimensions", help="Memory, latency and recall@4 per embedding size")
+    dimensions.add_argument("--qdrant-url", default=":memory:", help="Qdrant server (or :memory:)")
+    dimensions.add_argument("--cache", help="EmbeddingCache database to take real vectors from (default: synthetic)")
+    dimensions.add_argument("--dimensions", type=int, nargs='+', default=[256, 512, 1536])
+    dimensions.add_argument("--points", type=int, default=20000)
+    dimensions.add_argument("--queries", type=int, default=200)
+    dimensions.add_argument("--m", type=int, default=16)
+    dimensions.set_defaults(func=benchmark_dimensions)
+
+    local = subparsers.add_parser("local", help="Recall@4 and latency of the local vector index against Qdrant")
+    local.add_argument("--qdrant-url", default=":memory:", help="Qdrant server (or :memory:)")
+    local.add_argument("--cache", help="EmbeddingCache database to take real vectors from (default: synthetic)")
+    local.add_argument("--points", type=int, default=20000)
+    local.add_argument("--queries", type=int, default=200)
+    local.add_argument("--dimensions", type=int, default=1536)
+    local.add_argument("--m", type=int, default=16)
+    local.add_argument("--lists", type=int, help="IVF lists (default: square root of --points)")
+    local.add_argument("--nprobe", type=int, nargs='+', default=[4, 16, 64])
+    local.set_defaults(func=benchmark_local)
+
+    lexical = subparsers.add_parser("lexical", help="BM25 search latency of the lexical index")
+    lexical.add_argument("--chunks", type=int, default=1000000)
+    lexical.add_argument("--words", type=int, default=150, help="Words per chunk")
+    lexical.add_argument("--vocabulary", type=int, default=50000)
+    lexical.add_argument("--drugs", type=int, default=5000)
+    lexical.add_argument("--queries", type=int, default=200)
+    lexical.add_argument("--k", type=int, default=20, help="Hits per search (the hybrid search fetches 20)")
+    lexical.set_defaults(func=benchmark_lexical)
+
+    ingest = subparsers.add_parser("ingest", help="End-to-end indexing run with local embedding and Qdrant stand-ins")
+    ingest.add_argument("--zip", help="Zipped openFDA partition to use instead of synthetic data")
+    ingest.add_argument("--labels", type=int, default=1000, help="Labels in the synthetic partition")
+    ingest.add_argument("--latency", type=float, default=0.05, help="Seconds the fake embeddings server adds per request")
+    ingest.add_argument("--batch-size", type=int, default=64)
+    ingest.add_argument("--concurrency", type=int, default=8)
+    ingest.add_argument("--qdrant-path", help="Local on-disk Qdrant directory (default: in memory)")
+    ingest.add_argument("--qdrant-url", help="Scratch Qdrant server to index into instead; its fda_drugs collection is used")
+    ingest.add_argument("--bulk-load", action="store_true", help="Use the bulk upload path (needs --qdrant-url)")
+    ingest.add_argument("--lexical", action="store_true", help="Also build the BM25 lexical index")
+    ingest.add_argument("--no-dedup", action="store_true", help="Skip chunk deduplication, e.g. to compare peak RSS")
+    ingest.add_argument("--json", help="Write the report to this JSON file")
+    ingest.add_argument("--min-chunks-per-sec", type=float, help="Exit with an error below this throughput")
+    ingest.set_defaults(func=benchmark_ingest)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_CHECKPOINT_PATH = os.getenv("CHECKPOINT_PATH", "indexing_checkpoint.sqlite3")
+
+
+class IndexingCheckpoint:
+    """Records which batches of a source have been committed to Qdrant.
+
+    Progress is keyed by (source URL, content version), so a new version of a
+    partition starts from scratch while a restarted run of the same version
+    skips every batch that was already upserted. Each batch is recorded with
+    its chunk count and first and last point ID, so a batch is only skipped if
+    it still holds the same chunks. Each commit is written to SQLite
+    immediately, so a crash loses at most the batches in flight. Completed
+    sources can record the spl_ids they held, so labels that have left
+    every source can be found.
+    """
+
+    def __init__(self, path=DEFAULT_CHECKPOINT_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS committed_batches ("
+            "source TEXT NOT NULL, version TEXT NOT NULL, batch_index INTEGER NOT NULL, chunk_count INTEGER NOT NULL, "
+            "committed_at REAL NOT NULL, PRIMARY KEY (source, version, batch_index))")
+        # Checkpoints written before batch bounds were recorded have NULLs here, so they never match
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(committed_batches)")}
+        for column in ("first_id", "last_id"):
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE committed_batches ADD COLUMN {column} TEXT")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS completed_sources ("
+            "source TEXT NOT NULL, version TEXT NOT NULL, completed_at REAL NOT NULL, PRIMARY KEY (source, version))")
+        # NULL for sources completed without recording their labels
+        if "label_count" not in {row[1] for row in self._conn.execute("PRAGMA table_info(completed_sources)")}:
+            self._conn.execute("ALTER TABLE completed_sources ADD COLUMN label_count INTEGER")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS source_labels ("
+            "source TEXT NOT NULL, spl_id TEXT NOT NULL, PRIMARY KEY (source, spl_id)) WITHOUT ROWID")
+        self._conn.commit()
+
+    def committed_batches(self, source, version):
+        """Return {batch index: (chunk count, first point ID, last point ID)} of the committed batches."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT batch_index, chunk_count, first_id, last_id FROM committed_batches "
+                "WHERE source = ? AND version = ?", (source, version))
+            return {row[0]: tuple(row[1:]) for row in rows}
+
+    def commit_batch(self, source, version, batch_index, point_ids):
+        """Record a batch as committed, with the point IDs of its chunks in order."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO committed_batches "
+                "(source, version, batch_index, chunk_count, committed_at, first_id, last_id) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (source, version, batch_index, len(point_ids), time.time(), point_ids[0], point_ids[-1]))
+            self._conn.commit()
+
+    def is_complete(self, source, version):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM completed_sources WHERE source = ? AND version = ?", (source, version)).fetchone()
+            return row is not None
+
+    def mark_complete(self, source, version, spl_ids=None):
+        """Record that `source` is fully indexed, with the spl_ids it held, and drop its per-batch progress."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO completed_sources (source, version, completed_at, label_count) "
+                "VALUES (?, ?, ?, ?)", (source, version, time.time(), None if spl_ids is None else len(spl_ids)))
+            self._conn.execute("DELETE FROM committed_batches WHERE source = ?", (source,))
+            self._conn.execute("DELETE FROM source_labels WHERE source = ?", (source,))
+            if spl_ids is not None:
+                self._conn.executemany("INSERT INTO source_labels VALUES (?, ?)",
+                                       [(source, spl_id) for spl_id in spl_ids])
+            self._conn.commit()
+
+    def current_labels(self, sources, version):
+        """The spl_ids held by `sources`, or None unless every one completed `version` with its labels recorded."""
+        with self._lock:
+            labels = set()
+            for source in sources:
+                row = self._conn.execute("SELECT label_count FROM completed_sources WHERE source = ? AND version = ?",
+                                         (source, version)).fetchone()
+                if row is None or row[0] is None:
+                    return None
+                labels.update(spl_id for (spl_id,) in self._conn.execute(
+                    "SELECT spl_id FROM source_labels WHERE source = ?", (source,)))
+            return labels
+
+    def reset(self, source):
+        """Forget all progress for `source`, so the next run indexes it from the start."""
+        with self._lock:
+            self._conn.execute("DELETE FROM committed_batches WHERE source = ?", (source,))
+            self._conn.execute("DELETE FROM completed_sources WHERE source = ?", (source,))
+            self._conn.execute("DELETE FROM source_labels WHERE source = ?", (source,))
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,60 @@
+import json
+import os
+import sqlite3
+import threading
+import zstandard
+
+# Unset keeps chunk text and metadata in the Qdrant payload
+CHUNK_STORE_PATH = os.getenv("CHUNK_STORE_PATH")
+
+
+class ChunkStore:
+    """Chunk text and metadata stored outside Qdrant, keyed by point ID.
+
+    Each chunk is a zstd-compressed JSON document {"page_content", "metadata"}
+    in SQLite, so Qdrant only needs the vector and the small fields used for
+    filtering, and a search fetches the text of its hits here in one query.
+    """
+
+    def __init__(self, path=CHUNK_STORE_PATH, level=3):
+        self.path = path
+        self._lock = threading.Lock()
+        self._compressor = zstandard.ZstdCompressor(level=level)
+        self._decompressor = zstandard.ZstdDecompressor()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS chunks (id TEXT PRIMARY KEY, data BLOB NOT NULL)")
+        self._conn.commit()
+
+    def put_many(self, ids, documents):
+        """Store (page_content, metadata) pairs under the given point IDs."""
+        with self._lock:
+            rows = [(str(point_id), self._compressor.compress(
+                        json.dumps({"page_content": page_content, "metadata": metadata}).encode('utf-8')))
+                    for point_id, (page_content, metadata) in zip(ids, documents)]
+            self._conn.executemany("INSERT OR REPLACE INTO chunks VALUES (?, ?)", rows)
+            self._conn.commit()
+
+    def get_many(self, ids, batch_size=500):
+        """Return {point ID: (page_content, metadata)} for the IDs that are stored."""
+        ids = [str(point_id) for point_id in ids]
+        found = {}
+        with self._lock:
+            for i in range(0, len(ids), batch_size):
+                batch = ids[i:i + batch_size]
+                rows = self._conn.execute(
+                    f"SELECT id, data FROM chunks WHERE id IN ({','.join('?' * len(batch))})", batch)
+                for point_id, data in rows:
+                    document = json.loads(self._decompressor.decompress(data))
+                    found[point_id] = (document["page_content"], document["metadata"])
+        return found
+
+    def delete_many(self, ids):
+        with self._lock:
+            self._conn.executemany("DELETE FROM chunks WHERE id = ?", [(str(point_id),) for point_id in ids])
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
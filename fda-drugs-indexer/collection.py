@@ -0,0 +1,88 @@
+import os
+from qdrant_client.http import models
+
+# Embedding size, shared by the indexer, the collection schema and the query
+# side. text-embedding-3 models return shortened vectors when asked for fewer
+# dimensions; unset means the model's native 1536 and no `dimensions` parameter.
+EMBEDDING_DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS", "0")) or None
+
+# Vector storage of the fda_drugs collection. Quantized copies of the vectors
+# stay in RAM while the float32 originals can live on disk and are only read
+# to rescore the top candidates.
+VECTOR_SIZE = EMBEDDING_DIMENSIONS or 1536
+VECTOR_QUANTIZATION = os.getenv("VECTOR_QUANTIZATION", "none")  # none, scalar or binary
+VECTORS_ON_DISK = os.getenv("VECTORS_ON_DISK", "false").lower() == "true"
+HNSW_M = int(os.getenv("HNSW_M", "16"))
+HNSW_EF_CONSTRUCT = int(os.getenv("HNSW_EF_CONSTRUCT", "100"))
+# Segment size (KB of vectors) above which Qdrant builds an HNSW index; bulk
+# loads set it to 0 while uploading and restore this value afterwards
+INDEXING_THRESHOLD = int(os.getenv("INDEXING_THRESHOLD", "20000"))
+
+# Query-time settings: HNSW beam width (0 = server default) and how many extra
+# candidates to fetch from the quantized index before rescoring with originals
+SEARCH_HNSW_EF = int(os.getenv("SEARCH_HNSW_EF", "0")) or None
+QUANTIZATION_OVERSAMPLING = float(os.getenv("QUANTIZATION_OVERSAMPLING", "2.0"))
+
+# openFDA fields copied into top-level keyword payload fields for filtered search.
+# Dotted keys like "openfda.brand_name" read as nested paths in Qdrant filters,
+# so the values are stored again as lowercase lists under these names.
+FILTER_FIELDS = {
+    'openfda.generic_name': 'generic_name',
+    'openfda.brand_name': 'brand_name',
+    'openfda.route': 'route',
+    'openfda.product_type': 'product_type',
+}
+
+
+class VectorSizeMismatchError(Exception):
+    pass
+
+
+def check_vector_size(collection_info, size=VECTOR_SIZE):
+    """Raise VectorSizeMismatchError if an existing collection stores vectors of another size."""
+    collection_size = collection_info.config.params.vectors.size
+    if collection_size != size:
+        raise VectorSizeMismatchError(
+            f"Collection 'fda_drugs' holds {collection_size}-dimensional vectors but EMBEDDING_DIMENSIONS "
+            f"gives {size}. Set EMBEDDING_DIMENSIONS={collection_size}, or delete the collection and re-index.")
+
+
+def quantization_config(kind=VECTOR_QUANTIZATION):
+    if kind == "none":
+        return None
+    if kind == "scalar":
+        return models.ScalarQuantization(
+            scalar=models.ScalarQuantizationConfig(type=models.ScalarType.INT8, quantile=0.99, always_ram=True))
+    if kind == "binary":
+        return models.BinaryQuantization(binary=models.BinaryQuantizationConfig(always_ram=True))
+    raise ValueError(f"Unknown VECTOR_QUANTIZATION {kind!r}; expected none, scalar or binary")
+
+
+def vectors_config(size=VECTOR_SIZE, on_disk=VECTORS_ON_DISK):
+    return models.VectorParams(size=size, distance=models.Distance.COSINE, on_disk=on_disk)
+
+
+def hnsw_config(m=HNSW_M, ef_construct=HNSW_EF_CONSTRUCT):
+    return models.HnswConfigDiff(m=m, ef_construct=ef_construct)
+
+
+def search_params(quantized, hnsw_ef=SEARCH_HNSW_EF, oversampling=QUANTIZATION_OVERSAMPLING):
+    """Search params for a collection; quantized collections rescore oversampled candidates with the originals."""
+    if not quantized:
+        return models.SearchParams(hnsw_ef=hnsw_ef)
+    return models.SearchParams(
+        hnsw_ef=hnsw_ef,
+        quantization=models.QuantizationSearchParams(rescore=True, oversampling=oversampling),
+    )
+
+
+def collection_search_params(collection_info):
+    """Search params matching how an existing collection was actually created."""
+    return search_params(collection_info.config.quantization_config is not None)
+
+
+def filter_values(value):
+    """Lowercase values of a comma-separated openFDA metadata string, for keyword matching."""
+    if not value or value == 'Not Available':
+        return []
+    return list(dict.fromkeys(v.strip().lower() for v in value.split(',') if v.strip()))
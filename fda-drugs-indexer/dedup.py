@@ -0,0 +1,193 @@
+import hashlib
+import zlib
+import numpy as np
+
+# Label-level fields merged onto the chunk that represents a group of duplicates
+COVERAGE_FIELDS = {
+    'openfda.spl_id': 'covered_spl_ids',
+    'openfda.generic_name': 'covered_generic_names',
+    'openfda.brand_name': 'covered_brand_names',
+    'openfda.route': 'covered_routes',
+    'openfda.product_type': 'covered_product_types',
+    'openfda.manufacturer_name': 'covered_manufacturer_names',
+    'openfda.package_ndc': 'covered_package_ndcs',
+}
+
+_MERSENNE_PRIME = (1 << 61) - 1
+
+
+class MinHashLSH:
+    """MinHash band hashes over word shingles, for near-duplicate lookup.
+
+    A text's signature of `num_perm` = bands x rows MinHash values is reduced
+    to one 64-bit hash per band, and only those are kept. Two texts are
+    near-duplicates if the share of matching bands is at least
+    threshold ** rows, the expected share for texts with Jaccard similarity
+    `threshold`. Candidates are found by band: as a near-duplicate must match
+    enough bands, indexing the first `indexed_bands` is enough to find it.
+
+    Band hashes are kept in a numpy array, and the band index in sorted numpy
+    arrays, with recent inserts in a dict until they are merged in bulk.
+    """
+
+    def __init__(self, threshold=0.9, num_perm=128, bands=16, shingle_size=5, seed=1, merge_size=65536):
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        self.merge_size = merge_size
+        self.min_matching_bands = threshold ** self.rows * bands
+        self.indexed_bands = bands - int(np.ceil(self.min_matching_bands)) + 1
+        rng = np.random.RandomState(seed)
+        # Coefficients below 2**31 keep a*x + b for 32-bit shingle hashes within uint64
+        self._a = rng.randint(1, 1 << 31, size=num_perm).astype(np.uint64)
+        self._b = rng.randint(0, 1 << 31, size=num_perm).astype(np.uint64)
+        self.count = 0
+        self._band_hashes = np.empty((1024, bands), dtype=np.int64)
+        self._keys = np.empty(1024, dtype=np.int64)
+        # Band hash -> row of the first text indexed with it
+        self._recent = {}
+        self._sorted_hashes = np.empty(0, dtype=np.int64)
+        self._sorted_rows = np.empty(0, dtype=np.int64)
+
+    def signature(self, text):
+        words = text.lower().split()
+        size = self.shingle_size
+        shingles = {' '.join(words[i:i + size]) for i in range(max(len(words) - size + 1, 1))}
+        hashes = np.fromiter((zlib.crc32(shingle.encode('utf-8')) for shingle in shingles),
+                             dtype=np.uint64, count=len(shingles))
+        # Universal hashing (a*x + b) mod p, one row per permutation
+        permuted = (np.outer(self._a, hashes) + self._b[:, None]) % _MERSENNE_PRIME
+        return permuted.min(axis=1)
+
+    def band_hashes(self, text, salt=None):
+        """One hash per band of the text's signature; texts only match others with the same `salt`."""
+        signature = self.signature(text)
+        return np.array([hash((salt, band, signature[band * self.rows:(band + 1) * self.rows].tobytes()))
+                         for band in range(self.bands)], dtype=np.int64)
+
+    def query(self, band_hashes):
+        """Return the key of an indexed text similar to the one with `band_hashes`, or None."""
+        indexed = band_hashes[:self.indexed_bands]
+        rows = {self._recent[band_hash] for band_hash in indexed.tolist() if band_hash in self._recent}
+        if len(self._sorted_hashes):
+            positions = np.minimum(np.searchsorted(self._sorted_hashes, indexed), len(self._sorted_hashes) - 1)
+            rows.update(self._sorted_rows[positions[self._sorted_hashes[positions] == indexed]].tolist())
+        for row in sorted(rows):
+            if np.count_nonzero(self._band_hashes[row] == band_hashes) >= self.min_matching_bands:
+                return int(self._keys[row])
+        return None
+
+    def insert(self, key, band_hashes):
+        if self.count == len(self._keys):
+            self._band_hashes = np.concatenate([self._band_hashes, np.empty_like(self._band_hashes)])
+            self._keys = np.concatenate([self._keys, np.empty_like(self._keys)])
+        row = self.count
+        self.count += 1
+        self._band_hashes[row] = band_hashes
+        self._keys[row] = key
+        for band_hash in band_hashes[:self.indexed_bands].tolist():
+            self._recent.setdefault(band_hash, row)
+        # Merging costs a sort of the whole index, so the batch grows with it
+        if len(self._recent) >= max(self.merge_size, len(self._sorted_hashes) // 4):
+            self._merge()
+
+    def _merge(self):
+        hashes = np.concatenate([self._sorted_hashes,
+                                 np.fromiter(self._recent.keys(), dtype=np.int64, count=len(self._recent))])
+        rows = np.concatenate([self._sorted_rows,
+                               np.fromiter(self._recent.values(), dtype=np.int64, count=len(self._recent))])
+        order = np.lexsort((rows, hashes))
+        hashes, rows = hashes[order], rows[order]
+        # Like the dict, keep the first row per band hash
+        first = np.ones(len(hashes), dtype=bool)
+        first[1:] = hashes[1:] != hashes[:-1]
+        self._sorted_hashes, self._sorted_rows = hashes[first], rows[first]
+        self._recent = {}
+
+
+def _split_values(value):
+    if not value or value == 'Not Available':
+        return []
+    return [v.strip() for v in value.split(',') if v.strip()]
+
+
+def drug_key(chunk):
+    """The chunk's drug identity: its generic names, or else its substance names, or None."""
+    for field in ('openfda.generic_name', 'openfda.substance_name'):
+        values = _split_values(chunk.metadata.get(field))
+        if values:
+            return tuple(sorted({value.lower() for value in values}))
+    return None
+
+
+def _digest(text):
+    return int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def deduplicate_chunks(make_chunks, near_duplicate_threshold=0.9):
+    """Yield one chunk per group of exact or near-duplicate chunks.
+
+    `make_chunks` is called twice and must return the same chunk sequence each
+    time. The first pass groups chunks by content digest and, via MinHash LSH,
+    by near-identical text of the same drug (see drug_key), so one drug's
+    text never stands in for another's; chunks without a generic or
+    substance name are only deduplicated exactly. The second pass yields the
+    first chunk of every group with the spl_ids, generic and brand names,
+    routes, product types, manufacturers and NDCs of all its members added as
+    `covered_*` metadata lists, plus a `coverage_hash` of those lists.
+    Pass near_duplicate_threshold=None for exact deduplication only.
+
+    Partitions hold millions of chunks, so per chunk only an 8-byte digest
+    and its group number are kept, plus band hashes per group; label values
+    are only collected for the members after the first.
+    """
+    # Band hashes are salted with the drug, so texts of different drugs never match
+    lsh = MinHashLSH(threshold=near_duplicate_threshold) if near_duplicate_threshold else None
+    # Content digest -> group, numbered in order of the group's first chunk
+    group_of = {}
+    # Group -> label values of its members after the first, for groups with several
+    later_members = {}
+    groups = 0
+    total = 0
+
+    for chunk in make_chunks():
+        total += 1
+        digest = _digest(chunk.page_content)
+        group = group_of.get(digest)
+        if group is None:
+            key = drug_key(chunk) if lsh is not None else None
+            if key is not None:
+                band_hashes = lsh.band_hashes(chunk.page_content, salt=key)
+                group = lsh.query(band_hashes)
+            if group is None:
+                group = groups
+                groups += 1
+                group_of[digest] = group
+                if key is not None:
+                    lsh.insert(group, band_hashes)
+                # The first member's values are read from it in the second pass
+                continue
+            group_of[digest] = group
+        group_coverage = later_members.setdefault(group, {field: {} for field in COVERAGE_FIELDS.values()})
+        for field, coverage_field in COVERAGE_FIELDS.items():
+            for value in _split_values(chunk.metadata.get(field)):
+                group_coverage[coverage_field][value] = None
+    lsh = None
+
+    print(f"Deduplication: {total} chunks collapsed into {groups} unique chunks")
+
+    emitted = bytearray(groups)
+    for chunk in make_chunks():
+        group = group_of[_digest(chunk.page_content)]
+        if emitted[group]:
+            continue
+        emitted[group] = 1
+        later = later_members.pop(group, {})
+        group_coverage = {coverage_field: list(dict.fromkeys(_split_values(chunk.metadata.get(field))
+                                                             + list(later.get(coverage_field, ()))))
+                          for field, coverage_field in COVERAGE_FIELDS.items()}
+        chunk.metadata.update(group_coverage)
+        chunk.metadata['coverage_hash'] = hashlib.sha256(repr(sorted(group_coverage.items())).encode('utf-8')).hexdigest()
+        yield chunk
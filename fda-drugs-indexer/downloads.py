@@ -0,0 +1,171 @@
+import hashlib
+import json
+import os
+import re
+import requests
+from urllib.parse import urlparse
+
+DEFAULT_DOWNLOAD_CACHE_DIR = os.getenv("DOWNLOAD_CACHE_DIR", "download_cache")
+
+# S3-style ETags of single-part uploads are the MD5 of the object, so they double as a checksum
+_MD5_ETAG = re.compile(r'^"?([0-9a-f]{32})"?$')
+
+
+class DownloadError(Exception):
+    pass
+
+
+def _file_digests(path, chunk_size=1024 * 1024):
+    sha256, md5 = hashlib.sha256(), hashlib.md5()
+    with open(path, 'rb') as file_obj:
+        for block in iter(lambda: file_obj.read(chunk_size), b''):
+            sha256.update(block)
+            md5.update(block)
+    return sha256, md5
+
+
+class DownloadCache:
+    """Downloads archives into a local cache directory and revalidates them with conditional GETs.
+
+    Each URL is stored as `<cache_dir>/<url hash>-<file name>` with a `.meta.json`
+    sidecar holding its ETag, Last-Modified, size and SHA-256. A cached file
+    is only served after the server answers 304 Not Modified to a request
+    with If-None-Match / If-Modified-Since (or if the server is unreachable),
+    and after its size and checksum match the sidecar. Downloads stream to a
+    `.part` file; an interrupted download continues from where it stopped
+    with a Range request, guarded by If-Range so a changed file restarts
+    from scratch. A part that was complete when the process stopped gets
+    416 Range Not Satisfiable; it is finished if it passes the checks below
+    and downloaded again otherwise. Every completed download is checked against the
+    Content-Length and, where the ETag is an MD5, against the ETag.
+
+    Different URLs can be fetched from several threads or processes at once.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_DOWNLOAD_CACHE_DIR, chunk_size=1024 * 1024, timeout=60):
+        self.cache_dir = cache_dir
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+
+    def _paths(self, url):
+        # Prefixed with a hash of the full URL so files of the same name from different sources never collide
+        name = os.path.basename(urlparse(url).path) or 'download'
+        path = os.path.join(self.cache_dir, f"{hashlib.sha1(url.encode('utf-8')).hexdigest()[:12]}-{name}")
+        return path, path + '.meta.json', path + '.part'
+
+    def _read_meta(self, meta_path):
+        try:
+            with open(meta_path) as meta_file:
+                return json.load(meta_file)
+        except (OSError, ValueError):
+            return None
+
+    def _cached_file_valid(self, path, meta):
+        if meta is None or not os.path.exists(path) or os.path.getsize(path) != meta['size']:
+            return False
+        sha256, _ = _file_digests(path, self.chunk_size)
+        return sha256.hexdigest() == meta['sha256']
+
+    def fetch(self, url):
+        """Return (local path, sha256) of `url`, downloading it only if the cached copy is missing or stale."""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path, meta_path, part_path = self._paths(url)
+        meta = self._read_meta(meta_path)
+        if not self._cached_file_valid(path, meta):
+            meta = None
+
+        headers = {}
+        if meta is not None:
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
+
+        # Resume a partial download of the same version of the file
+        part_meta = self._read_meta(part_path + '.meta.json')
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        if offset and part_meta and part_meta.get('etag') and meta is None:
+            headers['Range'] = f"bytes={offset}-"
+            headers['If-Range'] = part_meta['etag']
+
+        try:
+            response = requests.get(url, headers=headers, stream=True, timeout=self.timeout)
+        except requests.RequestException as e:
+            if meta is None:
+                raise
+            print(f"Could not revalidate {url} ({e}); using cached copy")
+            return path, meta['sha256']
+
+        with response:
+            if response.status_code == 304 and meta is not None:
+                print(f"{url} not modified; using cached copy")
+                return path, meta['sha256']
+            if response.status_code == 416 and 'Range' in headers:
+                meta = self._finish_complete_part(url, response, part_path, path, part_meta['etag'])
+                if meta is None:
+                    print(f"Discarding partial download of {url}; downloading it again")
+                    for stale_path in (part_path, part_path + '.meta.json'):
+                        if os.path.exists(stale_path):
+                            os.remove(stale_path)
+                    return self.fetch(url)
+            else:
+                response.raise_for_status()
+                meta = self._download(url, response, part_path, path)
+
+        with open(meta_path, 'w') as meta_file:
+            json.dump(meta, meta_file)
+        return path, meta['sha256']
+
+    def _download(self, url, response, part_path, path):
+        etag = response.headers.get('ETag')
+        part_meta_path = part_path + '.meta.json'
+        if response.status_code == 206:
+            mode = 'ab'
+            expected_size = int(response.headers['Content-Range'].rsplit('/', 1)[-1])
+            print(f"Resuming download of {url} at byte {os.path.getsize(part_path)}")
+        else:
+            mode = 'wb'
+            expected_size = int(response.headers['Content-Length']) if 'Content-Length' in response.headers else None
+            # Record the version being downloaded so an interrupted download can be resumed
+            with open(part_meta_path, 'w') as part_meta_file:
+                json.dump({'etag': etag}, part_meta_file)
+
+        with open(part_path, mode) as part_file:
+            for chunk in response.iter_content(self.chunk_size):
+                part_file.write(chunk)
+        return self._finish(url, part_path, path, etag, expected_size, response.headers.get('Last-Modified'))
+
+    def _finish_complete_part(self, url, response, part_path, path, etag):
+        """Finish a part the server says is already whole (416), or return None if it is not that file."""
+        # 416 responses carry the full size as `Content-Range: bytes */<size>`
+        match = re.match(r'bytes \*/(\d+)$', response.headers.get('Content-Range', ''))
+        if match is None or int(match.group(1)) != os.path.getsize(part_path):
+            return None
+        if response.headers.get('ETag', etag) != etag:
+            return None
+        try:
+            return self._finish(url, part_path, path, etag, int(match.group(1)), response.headers.get('Last-Modified'))
+        except DownloadError:
+            return None
+
+    def _finish(self, url, part_path, path, etag, expected_size, last_modified):
+        part_meta_path = part_path + '.meta.json'
+        size = os.path.getsize(part_path)
+        if expected_size is not None and size != expected_size:
+            raise DownloadError(f"Incomplete download of {url}: {size} of {expected_size} bytes")
+        sha256, md5 = _file_digests(part_path, self.chunk_size)
+        etag_md5 = _MD5_ETAG.match(etag or '')
+        if etag_md5 and md5.hexdigest() != etag_md5.group(1):
+            os.remove(part_path)
+            os.remove(part_meta_path)
+            raise DownloadError(f"Checksum mismatch for {url}: MD5 {md5.hexdigest()} does not match ETag {etag}")
+
+        os.replace(part_path, path)
+        os.remove(part_meta_path)
+        return {
+            'url': url,
+            'etag': etag,
+            'last_modified': last_modified,
+            'size': size,
+            'sha256': sha256.hexdigest(),
+        }
@@ -0,0 +1,226 @@
+import array
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from langchain.embeddings.base import Embeddings
+
+DEFAULT_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "embedding_cache.sqlite3")
+DEFAULT_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "2000000"))
+# In-process tier for question embeddings: entries kept and seconds each stays valid
+QUERY_CACHE_MAX_ENTRIES = int(os.getenv("QUERY_CACHE_MAX_ENTRIES", "1024"))
+QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", "86400"))
+# Seconds question counts are kept in memory before they are written to the cache
+QUERY_COUNT_FLUSH_INTERVAL = float(os.getenv("QUERY_COUNT_FLUSH_INTERVAL", "60"))
+
+
+def normalize_query(text):
+    """Lowercase, collapse whitespace and drop trailing punctuation, so trivially different questions share a vector."""
+    return re.sub(r"[\s?!.]+$", "", " ".join(text.lower().split()))
+
+
+class EmbeddingCache:
+    """Disk-backed embedding cache keyed by (model, dimensions, text hash).
+
+    Vectors are stored as float32 blobs in SQLite. When the cache holds more
+    than `max_entries` vectors, the least recently used 10% are evicted.
+    Question counts are added up in memory and written at most every
+    `query_flush_interval` seconds, and on close().
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_entries=DEFAULT_MAX_ENTRIES,
+                 query_flush_interval=QUERY_COUNT_FLUSH_INTERVAL):
+        self.path = path
+        self.max_entries = max_entries
+        self.query_flush_interval = query_flush_interval
+        # Normalized question -> (times asked, last asked, question as last asked)
+        self._pending_queries = {}
+        self._queries_flushed = time.monotonic()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        # How often each (normalized) question was asked, to pre-warm the most frequent ones
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS queries (text TEXT PRIMARY KEY, count INTEGER NOT NULL, last_asked REAL NOT NULL, "
+            "question TEXT)")
+        # Caches created before the question as asked was kept
+        if "question" not in [row[1] for row in self._conn.execute("PRAGMA table_info(queries)")]:
+            self._conn.execute("ALTER TABLE queries ADD COLUMN question TEXT")
+        self._conn.commit()
+        self._count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    @staticmethod
+    def key(model, dimensions, text):
+        text_hash = hashlib.sha256(text.encode('utf-8')).hexdigest()
+        return f"{model}:{dimensions or 'default'}:{text_hash}"
+
+    def get_many(self, model, dimensions, texts):
+        """Return the cached vector for each text, or None where it is not cached."""
+        keys = [self.key(model, dimensions, text) for text in texts]
+        found = {}
+        with self._lock:
+            # Stay well below SQLite's limit on bound parameters
+            for i in range(0, len(keys), 500):
+                batch = keys[i:i + 500]
+                placeholders = ','.join('?' * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch).fetchall()
+                found.update(rows)
+            if found:
+                now = time.time()
+                self._conn.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?",
+                                       [(now, key) for key in found])
+                self._conn.commit()
+        return [array.array('f', found[key]).tolist() if key in found else None for key in keys]
+
+    def put_many(self, model, dimensions, texts, vectors):
+        now = time.time()
+        rows = [(self.key(model, dimensions, text), array.array('f', vector).tobytes(), now)
+                for text, vector in zip(texts, vectors) if vector is not None]
+        if not rows:
+            return
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.executemany("INSERT OR IGNORE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)", rows)
+            self._count += self._conn.total_changes - before
+            if self._count > self.max_entries:
+                self._evict()
+            self._conn.commit()
+
+    def record_query(self, text, question=None):
+        """Count one asking of the normalized question `text`, originally worded as `question`."""
+        with self._lock:
+            count = self._pending_queries[text][0] if text in self._pending_queries else 0
+            self._pending_queries[text] = (count + 1, time.time(), question or text)
+            if time.monotonic() - self._queries_flushed >= self.query_flush_interval:
+                self._flush_queries()
+
+    def _flush_queries(self):
+        if self._pending_queries:
+            self._conn.executemany(
+                "INSERT INTO queries (text, count, last_asked, question) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (text) DO UPDATE SET count = count + excluded.count, "
+                "last_asked = excluded.last_asked, question = excluded.question",
+                [(text, count, last_asked, question)
+                 for text, (count, last_asked, question) in self._pending_queries.items()])
+            self._conn.commit()
+            self._pending_queries = {}
+        self._queries_flushed = time.monotonic()
+
+    def frequent_queries(self, limit):
+        """The `limit` most often recorded questions as last asked, most frequent first."""
+        with self._lock:
+            self._flush_queries()
+            rows = self._conn.execute("SELECT COALESCE(question, text) FROM queries "
+                                      "ORDER BY count DESC, last_asked DESC LIMIT ?", (limit,))
+            return [row[0] for row in rows]
+
+    def _evict(self):
+        target = int(self.max_entries * 0.9)
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+            (self._count - target,))
+        self._count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._flush_queries()
+            self._conn.close()
+
+
+class QueryVectorCache:
+    """In-memory LRU cache of query text -> vector whose entries expire after `ttl` seconds."""
+
+    def __init__(self, max_entries=QUERY_CACHE_MAX_ENTRIES, ttl=QUERY_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, text):
+        with self._lock:
+            entry = self._entries.get(text)
+            if entry is None:
+                return None
+            vector, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[text]
+                return None
+            self._entries.move_to_end(text)
+            return vector
+
+    def put(self, text, vector):
+        with self._lock:
+            self._entries[text] = (vector, time.monotonic() + self.ttl)
+            self._entries.move_to_end(text)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class CachedEmbeddings(Embeddings):
+    """LangChain Embeddings wrapper that serves repeated texts from an EmbeddingCache.
+
+    Query vectors are cached under the normalized question and also kept in an
+    in-process QueryVectorCache, so a repeated question costs neither an API
+    call nor a disk read. The question itself is what gets embedded.
+    """
+
+    def __init__(self, embeddings, cache=None, query_cache=None):
+        self.embeddings = embeddings
+        self.cache = cache or EmbeddingCache()
+        self.query_cache = query_cache or QueryVectorCache()
+        self.model = embeddings.model
+        self.dimensions = getattr(embeddings, 'dimensions', None)
+
+    def _embed_cached(self, keys, texts):
+        """Vectors of `texts`, cached under `keys`; only the uncached ones are embedded."""
+        vectors = self.cache.get_many(self.model, self.dimensions, keys)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            new_vectors = self.embeddings.embed_documents([texts[i] for i in missing])
+            self.cache.put_many(self.model, self.dimensions, [keys[i] for i in missing], new_vectors)
+            for i, vector in zip(missing, new_vectors):
+                vectors[i] = vector
+        return vectors
+
+    def embed_documents(self, texts):
+        return self._embed_cached(texts, texts)
+
+    def embed_query(self, text):
+        key = normalize_query(text)
+        self.cache.record_query(key, text)
+        vector = self.query_cache.get(key)
+        if vector is not None:
+            return vector
+        vector = self.cache.get_many(self.model, self.dimensions, [key])[0]
+        if vector is None:
+            vector = self.embeddings.embed_query(text)
+            self.cache.put_many(self.model, self.dimensions, [key], [vector])
+        self.query_cache.put(key, vector)
+        return vector
+
+    def warm_queries(self, texts, frequent=0):
+        """Load query vectors for `texts` and the `frequent` most asked questions into memory.
+
+        Questions missing from the disk cache are embedded in one batch request.
+        """
+        questions = {}
+        for question in list(texts) + self.cache.frequent_queries(frequent):
+            questions.setdefault(normalize_query(question), question)
+        keys = [key for key in questions if self.query_cache.get(key) is None]
+        if not keys:
+            return 0
+        for key, vector in zip(keys, self._embed_cached(keys, [questions[key] for key in keys])):
+            if vector is not None:
+                self.query_cache.put(key, vector)
+        return len(keys)
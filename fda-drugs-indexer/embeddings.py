@@ -0,0 +1,241 @@
+import asyncio
+import random
+import time
+import httpx
+from tenacity import AsyncRetrying, retry_if_exception_type, stop_after_attempt, wait_random_exponential
+from metrics import EMBEDDING_BATCH_SIZE, EMBEDDING_REQUEST_SECONDS, EMBEDDING_RETRIES
+
+EMBEDDINGS_URL = "https://proxy.tune.app/v1/embeddings"
+
+# Status codes that mean "slow down or try again later" rather than a bad request
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class RetryableEmbeddingError(Exception):
+    """A throttled or transient failure; `retry_after` is the server's hint in seconds, if any."""
+
+    def __init__(self, message, retry_after=None, throttled=False):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.throttled = throttled
+
+
+class EmbeddingSizeError(Exception):
+    """The provider returned vectors of another size than requested; every further request would too."""
+
+
+def _parse_retry_after(response):
+    value = response.headers.get("Retry-After")
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        return None
+
+
+def _wait_retry_after(retry_state, backoff=wait_random_exponential(multiplier=0.5, max=60)):
+    """Honour Retry-After when the server sent one, otherwise back off exponentially with full jitter."""
+    error = retry_state.outcome.exception()
+    retry_after = getattr(error, 'retry_after', None)
+    if retry_after is not None:
+        return retry_after + random.uniform(0, 1)
+    return backoff(retry_state)
+
+
+class TokenBucket:
+    """Allows `rate` acquisitions per second on average, with bursts of up to `capacity`."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class AdaptiveConcurrencyLimiter:
+    """AIMD limit on requests in flight.
+
+    Each success raises the limit by 1/limit (about +1 per round of requests);
+    a throttled response halves it. Requests already in flight when the limit
+    was halved were sent at the old rate, so their throttled responses are
+    ignored: the limit halves at most once per round. It stays within
+    [1, max_limit].
+    """
+
+    def __init__(self, max_limit, initial_limit=None):
+        self.max_limit = max_limit
+        self.limit = float(initial_limit or max_limit)
+        self.in_flight = 0
+        self._issued = 0
+        self._last_decrease = 0
+        self._condition = asyncio.Condition()
+
+    async def acquire(self):
+        """Wait for a slot; returns the request's sequence number, to pass to release()."""
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+            self._issued += 1
+            return self._issued
+
+    async def release(self, sequence, throttled=False):
+        async with self._condition:
+            self.in_flight -= 1
+            if throttled:
+                if sequence > self._last_decrease:
+                    self.limit = max(1.0, self.limit / 2)
+                    self._last_decrease = self._issued
+            else:
+                self.limit = min(float(self.max_limit), self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+
+class EmbeddingClient:
+    """Async client for the embeddings proxy.
+
+    Texts are sent `batch_size` at a time (the `input` field accepts a list)
+    over one pooled connection set. Requests in flight are bounded by an AIMD
+    limit of at most `max_concurrency` and, if `requests_per_second` is set, by
+    a token bucket. 429 and 5xx responses and transport errors are retried up
+    to `max_attempts` times, honouring Retry-After. Texts found in `cache` (an
+    EmbeddingCache) are not sent. If `dimensions` is set, shortened vectors of
+    that size are requested, and a response of any other size fails the
+    call with EmbeddingSizeError and stops further requests.
+    """
+
+    def __init__(self, api_key, model, url=EMBEDDINGS_URL, batch_size=64, max_concurrency=8, timeout=60.0,
+                 cache=None, requests_per_second=None, max_attempts=10, dimensions=None):
+        self.url = url
+        self.model = model
+        self.dimensions = dimensions
+        self.cache = cache
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+        self.max_attempts = max_attempts
+        self._client = httpx.AsyncClient(
+            headers={
+                "Authorization": api_key,
+                "Content-Type": "application/json"
+            },
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency),
+        )
+        self.limiter = AdaptiveConcurrencyLimiter(max_concurrency)
+        self._bucket = TokenBucket(requests_per_second) if requests_per_second else None
+        self.retries = 0
+        self.throttled = 0
+        # Set by the first response of the wrong size, after which no more requests are sent
+        self._size_error = None
+
+    async def _post(self, data):
+        if self._bucket is not None:
+            await self._bucket.acquire()
+        sequence = await self.limiter.acquire()
+        # Requests queued for a slot when a response came back the wrong size are not sent
+        if self._size_error is not None:
+            await self.limiter.release(sequence)
+            raise self._size_error
+        throttled = False
+        outcome = "error"
+        start_time = time.perf_counter()
+        try:
+            try:
+                response = await self._client.post(self.url, json=data)
+            except httpx.TransportError as e:
+                raise RetryableEmbeddingError(f"{type(e).__name__}: {e}")
+            if response.status_code in RETRYABLE_STATUS_CODES:
+                # 429 and 503 mean the provider wants less traffic; other 5xx are treated as transient
+                throttled = response.status_code in (429, 503)
+                raise RetryableEmbeddingError(f"HTTP {response.status_code}",
+                                              retry_after=_parse_retry_after(response), throttled=throttled)
+            response.raise_for_status()
+            outcome = "ok"
+            return response.json()
+        finally:
+            EMBEDDING_REQUEST_SECONDS.labels("throttled" if throttled else outcome).observe(time.perf_counter() - start_time)
+            await self.limiter.release(sequence, throttled=throttled)
+
+    async def _embed_batch(self, texts):
+        data = {
+            "input": texts,
+            "model": self.model,
+            "encoding_format": "float"
+        }
+        if self.dimensions:
+            data["dimensions"] = self.dimensions
+        EMBEDDING_BATCH_SIZE.observe(len(texts))
+        async for attempt in AsyncRetrying(retry=retry_if_exception_type(RetryableEmbeddingError),
+                                           wait=_wait_retry_after,
+                                           stop=stop_after_attempt(self.max_attempts),
+                                           reraise=True):
+            with attempt:
+                if attempt.retry_state.attempt_number > 1:
+                    self.retries += 1
+                    EMBEDDING_RETRIES.inc()
+                try:
+                    body = await self._post(data)
+                except RetryableEmbeddingError as e:
+                    if e.throttled:
+                        self.throttled += 1
+                    raise
+        # The API may return embeddings out of order, each tagged with its input index
+        results = sorted(body['data'], key=lambda item: item['index'])
+        vectors = [item['embedding'] for item in results]
+        # A provider that ignores `dimensions` would otherwise fill the index with vectors of the wrong size
+        if self.dimensions and any(len(vector) != self.dimensions for vector in vectors):
+            self._size_error = EmbeddingSizeError(
+                f"Expected {self.dimensions}-dimensional embeddings from {self.model}, got {len(vectors[0])}; "
+                f"the provider may not support `dimensions`")
+            raise self._size_error
+        return vectors
+
+    async def embed_documents(self, texts):
+        """Embed `texts`, returning one vector per text (None where every retry failed).
+
+        Raises EmbeddingSizeError if the provider returns vectors of the wrong size.
+        """
+        if self.cache is None:
+            return await self._embed_uncached(texts)
+
+        # SQLite lookups, writes and eviction block, so they run off the event loop
+        vectors = await asyncio.to_thread(self.cache.get_many, self.model, self.dimensions, texts)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            missing_texts = [texts[i] for i in missing]
+            new_vectors = await self._embed_uncached(missing_texts)
+            await asyncio.to_thread(self.cache.put_many, self.model, self.dimensions, missing_texts, new_vectors)
+            for i, vector in zip(missing, new_vectors):
+                vectors[i] = vector
+        return vectors
+
+    async def _embed_uncached(self, texts):
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        results = await asyncio.gather(*(self._embed_batch(batch) for batch in batches), return_exceptions=True)
+        # Not a failure of some batches, but of the configuration: stop the run
+        if self._size_error is not None:
+            raise self._size_error
+
+        vectors = []
+        for batch, result in zip(batches, results):
+            if isinstance(result, Exception):
+                print(f"Failed to embed batch of {len(batch)} documents after retries: {result}")
+                vectors.extend([None] * len(batch))
+            else:
+                vectors.extend(result)
+        return vectors
+
+    async def aclose(self):
+        await self._client.aclose()
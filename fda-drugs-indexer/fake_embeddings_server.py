@@ -0,0 +1,126 @@
+# A local stand-in for the embeddings proxy, for exercising the indexer without
+# API keys. Vectors are deterministic per text, and the server can add latency
+# and inject throttling (429 with Retry-After) and transient 5xx errors.
+#
+# python fake_embeddings_server.py --port 8100 --latency 0.2 --max-rps 20 --error-rate 0.05
+#
+# Then point the indexer at it with EMBEDDINGS_URL=http://127.0.0.1:8100/v1/embeddings
+
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def fake_embedding(text, dimensions):
+    """Deterministic unit vector for `text`, so identical texts always get identical embeddings."""
+    rng = random.Random(hashlib.sha256(text.encode('utf-8')).digest())
+    vector = [rng.gauss(0, 1) for _ in range(dimensions)]
+    norm = sum(v * v for v in vector) ** 0.5
+    return [v / norm for v in vector]
+
+
+class FakeEmbeddingsServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, dimensions=1536, latency=0.0, max_rps=None, error_rate=0.0, retry_after=1):
+        super().__init__(address, FakeEmbeddingsHandler)
+        self.dimensions = dimensions
+        self.latency = latency
+        self.max_rps = max_rps
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.lock = threading.Lock()
+        self.window_start = time.monotonic()
+        self.window_requests = 0
+        self.stats = {"requests": 0, "throttled": 0, "errors": 0, "embedded": 0}
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1/embeddings"
+
+    def admit(self):
+        """Return the status code to answer with: 200, 429 when over max_rps, or an injected 500."""
+        with self.lock:
+            self.stats["requests"] += 1
+            now = time.monotonic()
+            if now - self.window_start >= 1.0:
+                self.window_start = now
+                self.window_requests = 0
+            self.window_requests += 1
+            if self.max_rps is not None and self.window_requests > self.max_rps:
+                self.stats["throttled"] += 1
+                return 429
+            if random.random() < self.error_rate:
+                self.stats["errors"] += 1
+                return 500
+            return 200
+
+    def start_in_thread(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+
+class FakeEmbeddingsHandler(BaseHTTPRequestHandler):
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length))
+        texts = request["input"] if isinstance(request["input"], list) else [request["input"]]
+        dimensions = request.get("dimensions") or self.server.dimensions
+
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        status = self.server.admit()
+        if status == 429:
+            self._send_json(429, {"error": {"message": "Rate limit exceeded"}},
+                            {"Retry-After": str(self.server.retry_after)})
+            return
+        if status != 200:
+            self._send_json(status, {"error": {"message": "Injected server error"}})
+            return
+
+        data = [{"object": "embedding", "index": i, "embedding": fake_embedding(text, dimensions)}
+                for i, text in enumerate(texts)]
+        with self.server.lock:
+            self.server.stats["embedded"] += len(texts)
+        self._send_json(200, {"object": "list", "data": data, "model": request.get("model")})
+
+    def _send_json(self, status, body, headers=None):
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local fake embeddings server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--dimensions", type=int, default=1536)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every request")
+    parser.add_argument("--max-rps", type=int, default=None, help="Requests per second before answering 429")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 500")
+    args = parser.parse_args()
+
+    server = FakeEmbeddingsServer((args.host, args.port), dimensions=args.dimensions, latency=args.latency,
+                                  max_rps=args.max_rps, error_rate=args.error_rate)
+    print(f"Fake embeddings server listening on {server.url}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+import itertools
+import zipfile
+import ijson
+import pandas as pd
+from langchain.docstore.document import Document
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+# Metadata fields to include with every chunk
+METADATA_FIELDS = ['openfda.brand_name', 'openfda.generic_name', 'openfda.manufacturer_name', 'openfda.product_type',
+                   'openfda.route', 'openfda.substance_name', 'openfda.rxcui', 'openfda.spl_id', 'openfda.package_ndc']
+
+# Label sections that make up the indexed text
+TEXT_FIELDS = ['description', 'indications_and_usage', 'contraindications', 'warnings', 'adverse_reactions',
+               'dosage_and_administration']
+
+OPENFDA_FIELDS = [field.split('.', 1)[1] for field in METADATA_FIELDS]
+
+
+def iter_label_records(zip_source, on_progress=None):
+    """Yield label records one at a time from a zipped openFDA JSON file.
+
+    `zip_source` is a path or a seekable file object. Only TEXT_FIELDS and the
+    openfda fields in METADATA_FIELDS are kept from each record, so memory use
+    does not depend on the size of the partition. If given, `on_progress` is
+    called after each record with the uncompressed bytes read and the total.
+    """
+    with zipfile.ZipFile(zip_source) as zip_file:
+        json_info = zip_file.infolist()[0]
+        with zip_file.open(json_info) as json_file:
+            for label in ijson.items(json_file, 'results.item'):
+                openfda = label.get('openfda', {})
+                record = {field: label.get(field) for field in TEXT_FIELDS}
+                for field, openfda_field in zip(METADATA_FIELDS, OPENFDA_FIELDS):
+                    record[field] = openfda.get(openfda_field)
+                if on_progress is not None:
+                    on_progress(json_file.tell(), json_info.file_size)
+                yield record
+
+
+def build_label_sections(records):
+    """Convert label records into (metadata, sections) pairs using column-wise operations.
+
+    `sections` lists the non-empty TEXT_FIELDS of the label as (name, text)
+    pairs in TEXT_FIELDS order. Only METADATA_FIELDS are kept as metadata, with
+    list values joined by ', ' and missing values set to 'Not Available'.
+    """
+    df = pd.DataFrame.from_records(records, columns=TEXT_FIELDS + METADATA_FIELDS)
+
+    texts = [df[field].str.join(' ').fillna('').str.strip().tolist() for field in TEXT_FIELDS]
+    sections = [[(field, text) for field, text in zip(TEXT_FIELDS, label_texts) if text]
+                for label_texts in zip(*texts)]
+
+    metadata = pd.DataFrame({field: df[field].str.join(', ').fillna('Not Available') for field in METADATA_FIELDS})
+    return list(zip(metadata.to_dict(orient='records'), sections))
+
+
+def iter_label_sections(zip_source, on_progress=None, batch_size=1000):
+    """Yield (metadata, sections) for each label in the zipped openFDA JSON file.
+
+    Records are converted `batch_size` at a time, so memory stays bounded.
+    """
+    records = iter_label_records(zip_source, on_progress)
+    while True:
+        batch = list(itertools.islice(records, batch_size))
+        if not batch:
+            break
+        yield from build_label_sections(batch)
+
+
+class SectionChunker:
+    """Split a label into chunks that never cross section boundaries.
+
+    Sections longer than `chunk_size` are split on their own (with
+    `chunk_overlap` characters of overlap inside the section); consecutive
+    shorter sections are packed together into one chunk without overlap. Each
+    chunk records the sections it covers in `metadata['sections']` and its
+    position in the label in `metadata['chunk_index']`.
+    """
+
+    def __init__(self, chunk_size=1000, chunk_overlap=0, separator='\n\n'):
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.separator = separator
+        self._splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+
+    def split_label(self, metadata, sections):
+        pieces = []
+        packed_texts = []
+        packed_sections = []
+        packed_length = 0
+
+        def flush():
+            nonlocal packed_texts, packed_sections, packed_length
+            if packed_texts:
+                pieces.append((self.separator.join(packed_texts), packed_sections))
+            packed_texts, packed_sections, packed_length = [], [], 0
+
+        for section, text in sections:
+            if len(text) > self.chunk_size:
+                flush()
+                pieces.extend((piece, [section]) for piece in self._splitter.split_text(text))
+                continue
+            if packed_texts and packed_length + len(self.separator) + len(text) > self.chunk_size:
+                flush()
+            packed_length += len(text) + (len(self.separator) if packed_texts else 0)
+            packed_texts.append(text)
+            packed_sections.append(section)
+        flush()
+
+        return [Document(page_content=text, metadata={**metadata, 'sections': chunk_sections, 'chunk_index': i})
+                for i, (text, chunk_sections) in enumerate(pieces)]
+
+
+def iter_label_chunks(labels, chunker):
+    """Lazily chunk each (metadata, sections) label with `chunker`."""
+    for metadata, sections in labels:
+        yield from chunker.split_label(metadata, sections)
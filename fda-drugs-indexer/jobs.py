@@ -0,0 +1,108 @@
+import asyncio
+import time
+import uuid
+
+FINISHED_STAGES = ("completed", "failed", "cancelled")
+
+
+class IndexingJob:
+    """State of one background ingestion run, as reported by GET /jobs/{id}."""
+
+    def __init__(self, kind, params):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.params = params
+        self.stage = "queued"
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.indexed = 0
+        self.processed = 0
+        # Points written by this job; indexed also counts chunks that were already in the collection
+        self.upserted = 0
+        # Best current estimate of the chunks this job will process, if known
+        self.expected_total = None
+        self.partitions_total = None
+        self.partitions_done = 0
+        # Seconds spent in each pipeline stage, summed over that stage's workers
+        self.stage_seconds = {}
+        self.error = None
+        self.task = None
+
+    @property
+    def finished(self):
+        return self.stage in FINISHED_STAGES
+
+    def add_stage_time(self, stage, seconds):
+        self.stage_seconds[stage] = self.stage_seconds.get(stage, 0.0) + seconds
+
+    def to_dict(self):
+        end_time = self.finished_at or time.time()
+        elapsed = end_time - self.started_at if self.started_at else 0.0
+        throughput = self.indexed / elapsed if elapsed > 0 else 0.0
+
+        eta = None
+        if not self.finished and self.expected_total and self.processed and elapsed > 0:
+            remaining = max(self.expected_total - self.processed, 0)
+            eta = remaining / (self.processed / elapsed)
+
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "params": self.params,
+            "stage": self.stage,
+            "indexed": self.indexed,
+            "processed": self.processed,
+            "upserted": self.upserted,
+            "expected_total": self.expected_total,
+            "partitions_total": self.partitions_total,
+            "partitions_done": self.partitions_done,
+            "elapsed_seconds": round(elapsed, 2),
+            "chunks_per_sec": round(throughput, 2),
+            "eta_seconds": round(eta, 1) if eta is not None else None,
+            "stage_seconds": {stage: round(seconds, 2) for stage, seconds in self.stage_seconds.items()},
+            "error": self.error,
+        }
+
+
+class JobManager:
+    """Runs ingestion coroutines as background tasks, at most `max_concurrent` at a time."""
+
+    def __init__(self, max_concurrent=1):
+        self.max_concurrent = max_concurrent
+        self.jobs = {}
+        self._semaphore = None
+
+    def submit(self, kind, params, run):
+        """Start `run(job)` in the background and return the job right away."""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent)
+        job = IndexingJob(kind, params)
+        self.jobs[job.id] = job
+        job.task = asyncio.create_task(self._run(job, run))
+        return job
+
+    async def _run(self, job, run):
+        try:
+            async with self._semaphore:
+                job.stage = "starting"
+                job.started_at = time.time()
+                await run(job)
+                job.stage = "completed"
+        except asyncio.CancelledError:
+            job.stage = "cancelled"
+        except Exception as e:
+            print(f"Job {job.id} failed: {e}")
+            job.stage = "failed"
+            job.error = str(e)
+        finally:
+            job.finished_at = time.time()
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def cancel(self, job_id):
+        job = self.jobs.get(job_id)
+        if job is not None and not job.finished:
+            job.task.cancel()
+        return job
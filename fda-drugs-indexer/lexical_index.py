@@ -0,0 +1,153 @@
+import os
+import re
+import sqlite3
+import threading
+
+# Unset builds no lexical index; the app then searches by embedding only
+LEXICAL_INDEX_PATH = os.getenv("LEXICAL_INDEX_PATH")
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "does", "for", "from", "how", "i", "if",
+    "in", "is", "it", "its", "me", "my", "not", "of", "on", "or", "should", "that", "the", "this", "to",
+    "was", "what", "when", "which", "who", "why", "will", "with", "you",
+}
+
+
+def tokenize(text):
+    return [token for token in re.findall(r"[a-z0-9][a-z0-9\-]*", text.lower()) if token not in STOPWORDS]
+
+
+class LexicalIndex:
+    """BM25 index over chunk text and drug names, keyed by chunk ID, in SQLite FTS5.
+
+    Text and names are two columns of an FTS5 table (unicode61 tokens, no
+    stemming), and a match in the names weighs `name_boost` times a match in
+    the text, so a chunk of a label for the named drug outranks chunks that
+    only mention it. Scoring is FTS5's bm25() (k1 = 1.2, b = 0.75). The exact
+    names are also kept, so callers can tell whether a question names an
+    indexed drug and search only its chunks.
+    """
+
+    def __init__(self, path=LEXICAL_INDEX_PATH, name_boost=3.0, max_df_ratio=0.25, max_df=10000):
+        self.path = path
+        self.name_boost = name_boost
+        # Terms in more chunks than this barely move BM25 scores, but take the longest to score
+        self.max_df_ratio = max_df_ratio
+        self.max_df = max_df
+        self._num_documents = None
+        # fts5vocab counts a term's chunks by reading all of them, so each count is read once
+        self._document_counts = {}
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        if self._conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'postings'").fetchone():
+            # Written by the earlier hand-rolled index, which cannot be converted; indexing again fills this one
+            for table in ("documents", "postings", "names"):
+                self._conn.execute(f"DROP TABLE IF EXISTS {table}")
+            print(f"Cleared the lexical index at {path}, which used an older layout; index the labels again to rebuild it")
+        # The FTS5 table reads its content from chunk_text, which is also needed to delete a chunk from it
+        self._conn.execute("CREATE TABLE IF NOT EXISTS chunk_text (rowid INTEGER PRIMARY KEY, id TEXT NOT NULL UNIQUE, "
+                           "text TEXT NOT NULL, names TEXT NOT NULL)")
+        self._conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS chunk_fts USING fts5(text, names, content='chunk_text', "
+                           "content_rowid='rowid', tokenize=\"unicode61 tokenchars '-'\")")
+        self._conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS chunk_vocab USING fts5vocab(chunk_fts, 'row')")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS chunk_names (name TEXT NOT NULL, rowid INTEGER NOT NULL, "
+                           "PRIMARY KEY (name, rowid)) WITHOUT ROWID")
+        self._conn.commit()
+
+    def add_many(self, ids, texts, names):
+        """Index chunks by ID with their text and list of (lowercase) drug names; known IDs are skipped."""
+        ids = [str(chunk_id) for chunk_id in ids]
+        with self._lock:
+            known = set()
+            for i in range(0, len(ids), 500):
+                batch = ids[i:i + 500]
+                known.update(row[0] for row in self._conn.execute(
+                    f"SELECT id FROM chunk_text WHERE id IN ({','.join('?' * len(batch))})", batch))
+
+            next_rowid = self._conn.execute("SELECT COALESCE(MAX(rowid), 0) + 1 FROM chunk_text").fetchone()[0]
+            rows, name_rows = [], []
+            for chunk_id, text, chunk_names in zip(ids, texts, names):
+                if chunk_id in known:
+                    continue
+                known.add(chunk_id)
+                rows.append((next_rowid, chunk_id, text, " ".join(chunk_names)))
+                name_rows += [(name, next_rowid) for name in chunk_names]
+                next_rowid += 1
+
+            self._conn.executemany("INSERT INTO chunk_text VALUES (?, ?, ?, ?)", rows)
+            self._conn.executemany("INSERT INTO chunk_fts (rowid, text, names) VALUES (?, ?, ?)",
+                                   [(rowid, text, chunk_names) for rowid, _, text, chunk_names in rows])
+            self._conn.executemany("INSERT OR IGNORE INTO chunk_names VALUES (?, ?)", name_rows)
+            self._conn.commit()
+            self._num_documents = None
+            self._document_counts = {}
+
+    def delete_many(self, ids):
+        with self._lock:
+            rows = []
+            for chunk_id in ids:
+                row = self._conn.execute("SELECT rowid, text, names FROM chunk_text WHERE id = ?",
+                                         (str(chunk_id),)).fetchone()
+                if row is not None:
+                    rows.append(row)
+            # An external-content FTS5 table is told the old values of each row it should forget
+            self._conn.executemany("INSERT INTO chunk_fts (chunk_fts, rowid, text, names) VALUES ('delete', ?, ?, ?)",
+                                   rows)
+            self._conn.executemany("DELETE FROM chunk_names WHERE rowid = ?", [(row[0],) for row in rows])
+            self._conn.executemany("DELETE FROM chunk_text WHERE rowid = ?", [(row[0],) for row in rows])
+            self._conn.commit()
+            self._num_documents = None
+            self._document_counts = {}
+
+    def known_names(self, candidates):
+        """The candidate names that belong to at least one indexed chunk."""
+        candidates = list(candidates)
+        if not candidates:
+            return []
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT DISTINCT name FROM chunk_names WHERE name IN ({','.join('?' * len(candidates))})", candidates)
+            return [row[0] for row in rows]
+
+    def search(self, query, k=10, names=None):
+        """Top-k [(chunk ID, BM25 score)] for `query`, optionally among chunks of the given drug names.
+
+        bm25() reads every chunk a term is in, even when searching only a
+        drug's chunks, so terms in more than `max_df_ratio` of the chunks (or
+        more than `max_df` chunks) are left out; a query of only such terms
+        finds nothing.
+        """
+        terms = sorted(set(tokenize(query)))
+        if not terms:
+            return []
+        with self._lock:
+            if self._num_documents is None:
+                self._num_documents = self._conn.execute("SELECT COUNT(*) FROM chunk_text").fetchone()[0]
+            missing = [term for term in terms if term not in self._document_counts]
+            if missing:
+                self._document_counts.update(dict.fromkeys(missing, 0))
+                self._document_counts.update(self._conn.execute(
+                    f"SELECT term, doc FROM chunk_vocab WHERE term IN ({','.join('?' * len(missing))})", missing))
+            max_df = min(self.max_df_ratio * self._num_documents, self.max_df)
+            terms = [term for term in terms if 0 < self._document_counts[term] <= max_df]
+            if not terms:
+                return []
+
+            # Quoted, so each term is matched as a string in any column rather than parsed as query syntax
+            match = " OR ".join(f'"{term}"' for term in terms)
+            name_clause = ""
+            if names:
+                name_clause = f" AND rowid IN (SELECT rowid FROM chunk_names WHERE name IN ({','.join('?' * len(names))}))"
+            # The top k are picked before joining chunk_text, which would otherwise be read for every match
+            rows = self._conn.execute(
+                "SELECT chunk_text.id, -top.score FROM (SELECT rowid, bm25(chunk_fts, 1.0, ?) AS score FROM chunk_fts "
+                f"WHERE chunk_fts MATCH ?{name_clause} ORDER BY score LIMIT ?) AS top "
+                "JOIN chunk_text ON chunk_text.rowid = top.rowid ORDER BY top.score",
+                [self.name_boost, match] + list(names or []) + [k])
+            return [(chunk_id, score) for chunk_id, score in rows]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
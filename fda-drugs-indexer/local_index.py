@@ -0,0 +1,284 @@
+# Embedded vector index, searched inside the app process instead of over the
+# network. Vectors sit in a memory-mapped float32 matrix and are scored with
+# batched matrix products; chunk text and metadata are in a ChunkStore. For
+# large corpora an optional IVF index (k-means lists) limits each search to
+# the lists closest to the query.
+#
+# Export the indexed collection from Qdrant once, and build the IVF index:
+# python local_index.py export local_index --ivf
+#
+# The app then searches it with no Qdrant at all when LOCAL_INDEX_PATH is set.
+# Compare recall and latency against Qdrant with `python benchmark.py local`.
+
+import argparse
+import json
+import os
+import time
+import numpy as np
+from dotenv import load_dotenv
+from chunk_store import ChunkStore
+from collection import FILTER_FIELDS
+from lexical_index import LexicalIndex
+
+LOCAL_INDEX_PATH = os.getenv("LOCAL_INDEX_PATH")
+# Inverted lists scanned per query when the index has an IVF index
+LOCAL_INDEX_NPROBE = int(os.getenv("LOCAL_INDEX_NPROBE", "16"))
+
+
+def normalize(vectors):
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def merge_top_k(best_scores, best_rows, scores, rows, k):
+    """Fold a block of (queries x rows) scores into the running top-k per query."""
+    scores = np.concatenate([best_scores, scores], axis=1)
+    rows = np.concatenate([best_rows, np.broadcast_to(rows, (len(scores), len(rows)))], axis=1)
+    if scores.shape[1] > k:
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        scores = np.take_along_axis(scores, top, axis=1)
+        rows = np.take_along_axis(rows, top, axis=1)
+    return scores, rows
+
+
+class LocalVectorIndex:
+    """Cosine-similarity index stored in a directory:
+
+    index.json       dimensions and row count
+    vectors.f32      unit-length float32 vectors, one row per chunk
+    chunks.sqlite3   ChunkStore of (page_content, metadata) keyed by row
+    lexical.sqlite3  LexicalIndex (BM25) of chunk text and drug names keyed by row
+    filters.json     {filter field: {value: [rows]}} for keyword filters
+    ivf.npz          optional IVF index: centroids, rows ordered by list, list offsets
+    """
+
+    def __init__(self, path, dimensions=None, block_rows=65536, nprobe=LOCAL_INDEX_NPROBE):
+        self.path = path
+        self.block_rows = block_rows
+        self.nprobe = nprobe
+        os.makedirs(path, exist_ok=True)
+        meta_path = os.path.join(path, "index.json")
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+        else:
+            meta = {"dimensions": dimensions, "count": 0}
+        self.dimensions = meta["dimensions"]
+        self.count = meta["count"]
+        self.chunk_store = ChunkStore(os.path.join(path, "chunks.sqlite3"))
+        self.lexical_index = LexicalIndex(os.path.join(path, "lexical.sqlite3"))
+
+        self.filters = {}
+        if os.path.exists(os.path.join(path, "filters.json")):
+            with open(os.path.join(path, "filters.json")) as f:
+                self.filters = json.load(f)
+        self.ivf = None
+        if os.path.exists(os.path.join(path, "ivf.npz")):
+            self.ivf = dict(np.load(os.path.join(path, "ivf.npz")))
+        self._vectors = None
+
+    @property
+    def vectors(self):
+        """The (count x dimensions) matrix, mapped from disk rather than read into memory."""
+        if self._vectors is None:
+            if self.count == 0:
+                return np.empty((0, self.dimensions or 0), dtype=np.float32)
+            self._vectors = np.memmap(os.path.join(self.path, "vectors.f32"), dtype=np.float32,
+                                      mode='r', shape=(self.count, self.dimensions))
+        return self._vectors
+
+    def flush(self):
+        """Write the row count and keyword filters, making rows added since the last flush visible on reopen."""
+        with open(os.path.join(self.path, "filters.json"), "w") as f:
+            json.dump(self.filters, f)
+        with open(os.path.join(self.path, "index.json"), "w") as f:
+            json.dump({"dimensions": self.dimensions, "count": self.count}, f)
+
+    def add(self, vectors, documents, filter_payloads=None):
+        """Append vectors with their (page_content, metadata) and keyword filter values.
+
+        Returns the new rows. Adding rows drops the IVF index, so rebuild it
+        afterwards. Metadata is only written by flush() (or close()), so a bulk
+        load pays for it once rather than on every call.
+        """
+        vectors = normalize(vectors)
+        if self.dimensions is None:
+            self.dimensions = vectors.shape[1]
+        elif vectors.shape[1] != self.dimensions:
+            raise ValueError(f"Expected vectors of size {self.dimensions}, got {vectors.shape[1]}")
+
+        rows = list(range(self.count, self.count + len(vectors)))
+        with open(os.path.join(self.path, "vectors.f32"), "ab") as f:
+            f.write(vectors.tobytes())
+        self.chunk_store.put_many(rows, documents)
+        names = [[name for field in ("generic_name", "brand_name") for name in payload.get(field, [])]
+                 for payload in filter_payloads or [{} for _ in rows]]
+        self.lexical_index.add_many(rows, [page_content for page_content, _ in documents], names)
+        for row, payload in zip(rows, filter_payloads or []):
+            for field, values in payload.items():
+                for value in (values if isinstance(values, list) else [values]):
+                    self.filters.setdefault(field, {}).setdefault(value, []).append(row)
+
+        self.count += len(rows)
+        self._vectors = None
+        if self.ivf is not None:
+            os.remove(os.path.join(self.path, "ivf.npz"))
+            self.ivf = None
+        return rows
+
+    def documents(self, rows):
+        """(page_content, metadata) for each row, in order."""
+        stored = self.chunk_store.get_many(rows)
+        return [stored[str(row)] for row in rows]
+
+    def rows_matching(self, filter):
+        """Rows where any {field: [values]} entry of `filter` matches."""
+        rows = set()
+        for field, values in filter.items():
+            for value in values:
+                rows.update(self.filters.get(field, {}).get(value, []))
+        return np.array(sorted(rows), dtype=np.int64)
+
+    def _search_rows(self, queries, rows, k):
+        best_scores = np.empty((len(queries), 0), dtype=np.float32)
+        best_rows = np.empty((len(queries), 0), dtype=np.int64)
+        for start in range(0, len(rows), self.block_rows):
+            block_rows = rows[start:start + self.block_rows]
+            scores = queries @ self.vectors[block_rows].T
+            best_scores, best_rows = merge_top_k(best_scores, best_rows, scores, block_rows, k)
+        return best_scores, best_rows
+
+    def _search_all(self, queries, k):
+        best_scores = np.empty((len(queries), 0), dtype=np.float32)
+        best_rows = np.empty((len(queries), 0), dtype=np.int64)
+        for start in range(0, self.count, self.block_rows):
+            # Contiguous slices of the memmap, read sequentially from disk
+            scores = queries @ self.vectors[start:start + self.block_rows].T
+            block_rows = np.arange(start, start + scores.shape[1])
+            best_scores, best_rows = merge_top_k(best_scores, best_rows, scores, block_rows, k)
+        return best_scores, best_rows
+
+    def search(self, queries, k=4, rows=None, exact=False):
+        """Top-k (scores, rows) per query, best first, as two (queries x k) arrays.
+
+        `rows` restricts the search to those rows. Otherwise, with an IVF index
+        and not `exact`, each query scans only its `nprobe` closest lists.
+        """
+        queries = normalize(queries)
+        if rows is not None:
+            scores, found = self._search_rows(queries, np.asarray(rows, dtype=np.int64), k)
+        elif self.ivf is None or exact:
+            scores, found = self._search_all(queries, k)
+        else:
+            centroids, order, offsets = self.ivf["centroids"], self.ivf["order"], self.ivf["offsets"]
+            nprobe = min(self.nprobe, len(centroids))
+            probes = np.argpartition(-(queries @ centroids.T), nprobe - 1, axis=1)[:, :nprobe]
+            results = [self._search_rows(query[None], np.sort(np.concatenate(
+                           [order[offsets[i]:offsets[i + 1]] for i in query_probes])), k)
+                       for query, query_probes in zip(queries, probes)]
+            width = min(len(s[0]) for s, _ in results)
+            scores = np.stack([s[0][:width] for s, _ in results])
+            found = np.stack([r[0][:width] for _, r in results])
+
+        order = np.argsort(-scores, axis=1)
+        return np.take_along_axis(scores, order, axis=1), np.take_along_axis(found, order, axis=1)
+
+    def build_ivf(self, lists=None, iterations=10, sample_size=100000, seed=0):
+        """Cluster the rows into `lists` inverted lists (default sqrt(rows)) with spherical k-means."""
+        lists = min(lists or max(1, int(np.sqrt(self.count))), self.count)
+        rng = np.random.default_rng(seed)
+        sample = np.asarray(self.vectors[np.sort(rng.choice(self.count, min(self.count, sample_size), replace=False))])
+        centroids = sample[rng.choice(len(sample), lists, replace=False)].copy()
+        for _ in range(iterations):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, sample)
+            # Lists that lost all their members keep their old centroid
+            filled = np.bincount(assignment, minlength=lists) > 0
+            centroids[filled] = normalize(sums[filled])
+
+        assignment = np.concatenate([np.argmax(self.vectors[start:start + self.block_rows] @ centroids.T, axis=1)
+                                     for start in range(0, self.count, self.block_rows)])
+        order = np.argsort(assignment, kind='stable')
+        offsets = np.searchsorted(assignment[order], np.arange(lists + 1))
+        self.ivf = {"centroids": centroids, "order": order, "offsets": offsets}
+        np.savez(os.path.join(self.path, "ivf.npz"), **self.ivf)
+
+    def close(self):
+        self.flush()
+        self.chunk_store.close()
+        self.lexical_index.close()
+
+
+def export_collection(client, path, collection_name="fda_drugs", chunk_store=None, batch_size=1000):
+    """Copy every point of a Qdrant collection into a new LocalVectorIndex at `path`.
+
+    Handles both payload layouts: the indexer's flat one, whose text may be in
+    `chunk_store`, and LangChain's {"page_content", "metadata"}.
+    """
+    index = LocalVectorIndex(path)
+    if index.count:
+        raise ValueError(f"{path} already holds {index.count} vectors")
+    if os.path.exists(os.path.join(path, "vectors.f32")):
+        raise ValueError(f"{path} holds an unfinished export; remove it first")
+    offset = None
+    while True:
+        points, offset = client.scroll(collection_name, limit=batch_size, offset=offset,
+                                       with_payload=True, with_vectors=True)
+        stored = chunk_store.get_many([point.id for point in points]) if chunk_store else {}
+        documents = []
+        filter_payloads = []
+        for point in points:
+            payload = point.payload or {}
+            if str(point.id) in stored:
+                documents.append(stored[str(point.id)])
+            elif "metadata" in payload:
+                documents.append((payload.get("page_content", ""), payload["metadata"] or {}))
+            else:
+                documents.append((payload.get("page_content", ""),
+                                  {key: value for key, value in payload.items() if key != "page_content"}))
+            filter_payloads.append({field: payload[field] for field in FILTER_FIELDS.values() if field in payload})
+        if points:
+            index.add([point.vector for point in points], documents, filter_payloads)
+        if offset is None:
+            break
+    index.flush()
+    return index
+
+
+def main():
+    load_dotenv()
+    from qdrant_client import QdrantClient
+    from chunk_store import CHUNK_STORE_PATH
+
+    parser = argparse.ArgumentParser(description="Build a local vector index from the fda_drugs collection")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export = subparsers.add_parser("export", help="Copy the Qdrant collection into a new local index")
+    export.add_argument("path")
+    export.add_argument("--qdrant-url", default=os.getenv("QDRANT_CLUSTER_URL"))
+    export.add_argument("--collection", default="fda_drugs")
+    export.add_argument("--ivf", action="store_true", help="Also build the IVF index for approximate search")
+    export.add_argument("--lists", type=int, help="IVF lists (default: square root of the row count)")
+    ivf = subparsers.add_parser("ivf", help="(Re)build the IVF index of an existing local index")
+    ivf.add_argument("path")
+    ivf.add_argument("--lists", type=int, help="IVF lists (default: square root of the row count)")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.command == "export":
+        client = QdrantClient(url=args.qdrant_url, api_key=os.getenv("QDRANT_API_KEY"))
+        chunk_store = ChunkStore(CHUNK_STORE_PATH) if CHUNK_STORE_PATH else None
+        index = export_collection(client, args.path, args.collection, chunk_store=chunk_store)
+        print(f"Exported {index.count} vectors of size {index.dimensions} in {time.perf_counter() - start:.1f}s")
+    else:
+        index = LocalVectorIndex(args.path)
+    if args.command == "ivf" or args.ivf:
+        start = time.perf_counter()
+        index.build_ivf(lists=args.lists)
+        print(f"Built IVF index with {len(index.ivf['centroids'])} lists in {time.perf_counter() - start:.1f}s")
+    index.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -15,7 +15,7 @@
 # kill -9 2540
 
 # Example of a POST request from Postman or any other HTTP client:
-# This request indexes data from a specified URL:
+# This request starts a background job that indexes data from a specified URL:
 # You can call this endpoint by sending a POST request to:
 # http://your_server_url/index_fda_drugs?url=https://download.open.fda.gov/drug/label/drug-label-0001-of-0012.json.zip
 # where the URL is passed as a query parameter.
@@ -24,23 +24,56 @@
 # Local URL testing with curl:
 # curl -X POST "http://127.0.0.1:8000/index_fda_drugs?url=https://download.open.fda.gov/drug/label/drug-label-0001-of-0012.json.zip"
 
+# Index every drug label partition listed in the openFDA download manifest:
+# curl -X POST "http://127.0.0.1:8000/index_fda_drugs_all"
+
+# For an initial build of the collection, add bulk_load=true: points are streamed
+# with upload_points (over gRPC if QDRANT_PREFER_GRPC=true) while HNSW indexing is
+# off, and the index is built once at the end:
+# curl -X POST "http://127.0.0.1:8000/index_fda_drugs_all?bulk_load=true"
+# Once built, save the collection with `python snapshots.py create fda_drugs.snapshot`;
+# new deployments restore that file instead of indexing again.
+
+# Both return a job id right away, and resume from the last committed batch of an
+# interrupted run unless resume=false is passed. Check progress, or cancel the job, with:
+# curl "http://127.0.0.1:8000/jobs/<job_id>"
+# curl -X POST "http://127.0.0.1:8000/jobs/<job_id>/cancel"
+
+# Stage durations, embedding request latency, failed chunks, queue depths and
+# throughput are exported for Prometheus at:
+# curl "http://127.0.0.1:8000/metrics"
+
 import asyncio
+import hashlib
+import itertools
+import json
+import multiprocessing
+import queue
+import tempfile
+import threading
 import time
-from qdrant_client import AsyncQdrantClient
+from concurrent.futures import ProcessPoolExecutor
+from qdrant_client import AsyncQdrantClient, QdrantClient
 from qdrant_client.http import models
-import pandas as pd
-import zipfile
-import io
-import requests
-import json
-from langchain_openai import OpenAIEmbeddings
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.docstore.document import Document
-from langchain_community.document_loaders import DataFrameLoader
 import uuid
 import os
 from dotenv import load_dotenv
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import FastAPI, HTTPException, Query, Response
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from embeddings import EmbeddingClient
+from embedding_cache import EmbeddingCache
+from checkpoint import IndexingCheckpoint
+from chunk_store import CHUNK_STORE_PATH, ChunkStore
+from dedup import COVERAGE_FIELDS, deduplicate_chunks
+from lexical_index import LEXICAL_INDEX_PATH, LexicalIndex
+from collection import (EMBEDDING_DIMENSIONS, FILTER_FIELDS, INDEXING_THRESHOLD, check_vector_size, filter_values,
+                        hnsw_config, quantization_config, vectors_config)
+from downloads import DownloadCache
+from fda_labels import METADATA_FIELDS, SectionChunker, iter_label_sections, iter_label_chunks
+from jobs import JobManager
+from metrics import (CHUNKS_FAILED, CHUNKS_INDEXED, CHUNKS_UPSERTED, EMBEDDING_CONCURRENCY_LIMIT, QUEUE_DEPTH,
+                     RUNNING_JOBS, STAGE_SECONDS, THROUGHPUT)
+from partitions import fetch_partition_manifest, split_partition, iter_spooled_documents
 
 app = FastAPI()
 
@@ -53,7 +86,80 @@ model = os.getenv("model")
 
 QDRANT_API_KEY = os.getenv("QDRANT_API_KEY")
 QDRANT_CLUSTER_URL = os.getenv("QDRANT_CLUSTER_URL")
-client = AsyncQdrantClient(QDRANT_CLUSTER_URL, api_key=QDRANT_API_KEY)
+QDRANT_PREFER_GRPC = os.getenv("QDRANT_PREFER_GRPC", "false").lower() == "true"
+client = AsyncQdrantClient(QDRANT_CLUSTER_URL, api_key=QDRANT_API_KEY, prefer_grpc=QDRANT_PREFER_GRPC)
+# Bulk loads go through the synchronous client, whose upload_points runs in a
+# worker thread and fans batches out to BULK_UPLOAD_PARALLEL processes
+bulk_client = QdrantClient(QDRANT_CLUSTER_URL, api_key=QDRANT_API_KEY, prefer_grpc=QDRANT_PREFER_GRPC)
+
+# Namespace for deterministic point IDs, so re-indexing a label reuses the IDs of unchanged chunks
+POINT_ID_NAMESPACE = uuid.UUID("6f1c2f7e-8a0b-4d36-9a53-3f1e0b6c9d21")
+
+# Texts per embeddings request, maximum requests in flight (adapted down on 429s),
+# optional request rate cap and attempts per request
+EMBEDDINGS_URL = os.getenv("EMBEDDINGS_URL", "https://proxy.tune.app/v1/embeddings")
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+EMBEDDING_CONCURRENCY = int(os.getenv("EMBEDDING_CONCURRENCY", "8"))
+EMBEDDING_REQUESTS_PER_SECOND = float(os.getenv("EMBEDDING_REQUESTS_PER_SECOND", "0")) or None
+EMBEDDING_MAX_ATTEMPTS = int(os.getenv("EMBEDDING_MAX_ATTEMPTS", "10"))
+embedding_client = None
+embedding_cache = None
+checkpoint = None
+# With CHUNK_STORE_PATH set, chunk text and label metadata are kept in a local
+# compressed store and Qdrant payloads carry only the fields used in filters
+chunk_store = None
+# With LEXICAL_INDEX_PATH set, indexed chunks are also added to a local BM25
+# index that the app fuses with dense results and uses for name-only lookups
+lexical_index = None
+
+# Indexing pipeline: chunks per batch, workers per stage and batches queued between stages
+INDEX_BATCH_SIZE = int(os.getenv("INDEX_BATCH_SIZE", "500"))
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", "2"))
+UPSERT_WORKERS = int(os.getenv("UPSERT_WORKERS", "2"))
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "4"))
+
+# Bulk-load mode: points per upload request and upload processes
+BULK_UPLOAD_BATCH_SIZE = int(os.getenv("BULK_UPLOAD_BATCH_SIZE", "256"))
+BULK_UPLOAD_PARALLEL = int(os.getenv("BULK_UPLOAD_PARALLEL", "4"))
+
+# Collapse exact duplicate chunks, and near duplicates at this estimated Jaccard similarity (0 disables)
+DEDUPLICATE_CHUNKS = os.getenv("DEDUPLICATE_CHUNKS", "true").lower() == "true"
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv("NEAR_DUPLICATE_THRESHOLD", "0.9")) or None
+
+# Ingestion runs as background jobs; jobs beyond this limit wait in the queue
+MAX_CONCURRENT_JOBS = int(os.getenv("MAX_CONCURRENT_JOBS", "1"))
+job_manager = JobManager(max_concurrent=MAX_CONCURRENT_JOBS)
+# (embed queue, upsert queue) of every pipeline running now, for the queue depth metric
+active_pipelines = []
+
+# Partition archives are kept in DOWNLOAD_CACHE_DIR and only fetched again when they change
+download_cache = DownloadCache()
+
+@app.on_event("startup")
+async def startup():
+    global embedding_client, embedding_cache, checkpoint, chunk_store, lexical_index
+    embedding_cache = EmbeddingCache()
+    checkpoint = IndexingCheckpoint()
+    chunk_store = ChunkStore(CHUNK_STORE_PATH) if CHUNK_STORE_PATH else None
+    lexical_index = LexicalIndex(LEXICAL_INDEX_PATH) if LEXICAL_INDEX_PATH else None
+    embedding_client = EmbeddingClient(TUNE_API_KEY, model,
+                                       url=EMBEDDINGS_URL,
+                                       batch_size=EMBEDDING_BATCH_SIZE,
+                                       max_concurrency=EMBEDDING_CONCURRENCY,
+                                       cache=embedding_cache,
+                                       requests_per_second=EMBEDDING_REQUESTS_PER_SECOND,
+                                       max_attempts=EMBEDDING_MAX_ATTEMPTS,
+                                       dimensions=EMBEDDING_DIMENSIONS)
+
+@app.on_event("shutdown")
+async def shutdown():
+    await embedding_client.aclose()
+    embedding_cache.close()
+    checkpoint.close()
+    if chunk_store is not None:
+        chunk_store.close()
+    if lexical_index is not None:
+        lexical_index.close()
 
 async def create_collection():
     try:
@@ -63,117 +169,581 @@ async def create_collection():
         print(f"Collection 'fda_drugs' does not exist. Creating...")
         collection_info = await client.create_collection(
             collection_name="fda_drugs",
-            vectors_config=models.VectorParams(size=1536, distance=models.Distance.COSINE)
+            vectors_config=vectors_config(),
+            hnsw_config=hnsw_config(),
+            quantization_config=quantization_config(),
         )
         print(f"Collection 'fda_drugs' created: {collection_info}")
+    else:
+        # Refuse to add vectors of a different size than the collection was built with
+        check_vector_size(collection_info)
 
-async def index_batch(batch_docs, metadata_fields):
-    points = []
-    url = "https://proxy.tune.app/v1/embeddings"
-    headers = {
-        "Authorization": TUNE_API_KEY,
-        "Content-Type": "application/json"
-    }
+    # Re-indexing deletes stale chunks by label, and search can be restricted to
+    # label sections or to a drug's generic/brand name, route and product type
+    for field_name in ("spl_id", "sections", *FILTER_FIELDS.values()):
+        await client.create_payload_index(
+            collection_name="fda_drugs",
+            field_name=field_name,
+            field_schema=models.PayloadSchemaType.KEYWORD,
+        )
+
+def chunk_point_id(doc):
+    """Deterministic point ID from the label's spl_id, chunk position and content hash.
+
+    For a chunk standing in for duplicates, the hash of the labels it covers is
+    included too, so a change in coverage produces a new point.
+    """
+    spl_id = doc.metadata.get('openfda.spl_id', '')
+    key = f"{spl_id}:{doc.metadata.get('chunk_index', 0)}:{doc.metadata['content_hash']}"
+    if doc.metadata.get('coverage_hash'):
+        key += f":{doc.metadata['coverage_hash']}"
+    return str(uuid.uuid5(POINT_ID_NAMESPACE, key))
+
+def covered_spl_ids(doc):
+    """spl_ids of every label a chunk stands for."""
+    return doc.metadata.get('covered_spl_ids') or [doc.metadata.get('openfda.spl_id', '')]
+
+def collect_spl_ids(docs, spl_ids):
+    """Yield `docs`, adding the spl_ids each one covers to the set `spl_ids`."""
+    for doc in docs:
+        spl_ids.update(covered_spl_ids(doc))
+        yield doc
 
+def payload_filter_values(doc):
+    """Keyword filter fields for a chunk, including the values of every label it covers."""
+    values = {}
+    for field, filter_field in FILTER_FIELDS.items():
+        values[filter_field] = filter_values(doc.metadata.get(field))
+        for covered_value in doc.metadata.get(COVERAGE_FIELDS[field], []):
+            values[filter_field] += [v for v in filter_values(covered_value) if v not in values[filter_field]]
+    return values
+
+def pipeline_fingerprint():
+    """Hash of the settings that decide which chunks exist and how they fall into batches.
+
+    It is part of the checkpoint version, so changing any of them re-indexes a
+    partition instead of resuming from batches cut differently.
+    """
+    chunker = SectionChunker()
+    settings = [INDEX_BATCH_SIZE, DEDUPLICATE_CHUNKS, NEAR_DUPLICATE_THRESHOLD,
+                chunker.chunk_size, chunker.chunk_overlap, chunker.separator]
+    return hashlib.sha256(json.dumps(settings).encode('utf-8')).hexdigest()[:12]
+
+def assign_content_hashes(batch_docs):
     for doc in batch_docs:
-        try:
-            data = {
-                "input": doc.page_content,
-                "model": model,
-                "encoding_format": "float"
-            }
-            response = requests.post(url, headers=headers, json=data)
-            vector = response.json()['data'][0]['embedding']
-            if vector is not None:
-                payload = {field: doc.metadata.get(field, '') for field in metadata_fields}
-                payload["page_content"] = doc.page_content
-                points.append(models.PointStruct(
-                    id=str(uuid.uuid4()),
-                    payload=payload,
-                    vector=vector,
-                ))
-        except Exception as e:
-            print(f"Failed to index document: {e}")
-    
+        doc.metadata['content_hash'] = hashlib.sha256(doc.page_content.encode('utf-8')).hexdigest()
+
+async def embed_batch(batch_docs, metadata_fields):
+    """Embed the chunks that are not already indexed; returns (points to upsert, IDs already indexed).
+
+    With a chunk store, the text and metadata of the new chunks are written
+    to it here, before their points reach Qdrant. With a lexical index, new
+    and already indexed chunks are added to it (chunks it has are skipped).
+    """
+    points = []
+    stored_ids = []
+    stored_documents = []
+    assign_content_hashes(batch_docs)
+    point_ids = [chunk_point_id(doc) for doc in batch_docs]
+
+    # A chunk whose ID already exists has identical content, so it needs no new embedding
+    existing = await client.retrieve(collection_name="fda_drugs", ids=point_ids, with_payload=False, with_vectors=False)
+    existing_ids = {str(point.id) for point in existing}
+    new_chunks = [(point_id, doc) for point_id, doc in zip(point_ids, batch_docs) if point_id not in existing_ids]
+    vectors = await embedding_client.embed_documents([doc.page_content for _, doc in new_chunks])
+
+    for (point_id, doc), vector in zip(new_chunks, vectors):
+        if vector is not None:
+            metadata = {field: doc.metadata.get(field, '') for field in metadata_fields}
+            for coverage_field in COVERAGE_FIELDS.values():
+                if coverage_field in doc.metadata:
+                    metadata[coverage_field] = doc.metadata[coverage_field]
+            # Fields that deletes and filtered searches match on always stay in Qdrant
+            filter_payload = {"spl_id": covered_spl_ids(doc)}
+            filter_payload.update(payload_filter_values(doc))
+            filter_payload["chunk_index"] = doc.metadata.get('chunk_index', 0)
+            filter_payload["sections"] = doc.metadata.get('sections', [])
+            filter_payload["content_hash"] = doc.metadata['content_hash']
+
+            if chunk_store is None:
+                payload = {**metadata, "page_content": doc.page_content, **filter_payload}
+            else:
+                payload = filter_payload
+                stored_ids.append(point_id)
+                stored_documents.append((doc.page_content, {**metadata, **filter_payload}))
+            points.append(models.PointStruct(
+                id=point_id,
+                payload=payload,
+                vector=vector,
+            ))
+    CHUNKS_FAILED.labels("embed").inc(len(new_chunks) - len(points))
+    if stored_ids:
+        await asyncio.to_thread(chunk_store.put_many, stored_ids, stored_documents)
+    if lexical_index is not None:
+        lexical_ids = existing_ids | {point.id for point in points}
+        lexical_docs = [(point_id, doc) for point_id, doc in zip(point_ids, batch_docs) if point_id in lexical_ids]
+        names = [payload_filter_values(doc) for _, doc in lexical_docs]
+        await asyncio.to_thread(lexical_index.add_many,
+                                [point_id for point_id, _ in lexical_docs],
+                                [doc.page_content for _, doc in lexical_docs],
+                                [values['generic_name'] + values['brand_name'] for values in names])
+    return points, list(existing_ids)
+
+async def upsert_batch(points):
+    """Upsert embedded points; returns the IDs that were committed."""
     if points:
         try:
             response = await client.upsert(
                 collection_name="fda_drugs",
                 points=points,
             )
-            return len(points)
+            return [point.id for point in points]
         except Exception as e:
             print(f"Failed to upsert batch: {e}")
+            CHUNKS_FAILED.labels("upsert").inc(len(points))
     
-    return 0
+    return []
+
+async def begin_bulk_load():
+    """Stop HNSW indexing, so points are only appended to segments while loading."""
+    await client.update_collection(collection_name="fda_drugs",
+                                   optimizer_config=models.OptimizersConfigDiff(indexing_threshold=0))
+
+async def end_bulk_load(job=None, poll_interval=5):
+    """Turn HNSW indexing back on and, with a job, wait until the index has been built."""
+    await client.update_collection(collection_name="fda_drugs",
+                                   optimizer_config=models.OptimizersConfigDiff(indexing_threshold=INDEXING_THRESHOLD))
+    if job is None:
+        return
+    job.stage = "building index"
+    stage_start = time.perf_counter()
+    while (await client.get_collection(collection_name="fda_drugs")).status != models.CollectionStatus.GREEN:
+        await asyncio.sleep(poll_interval)
+    record_stage_time(job, "index build", time.perf_counter() - stage_start)
+
+async def delete_stale_chunks(label_point_ids, max_concurrency=16):
+    """Delete points of each re-indexed label that are not part of its current chunk set."""
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def delete_label(spl_id, point_ids):
+        stale_filter = models.Filter(
+            must=[models.FieldCondition(key="spl_id", match=models.MatchValue(value=spl_id))],
+            must_not=[models.HasIdCondition(has_id=list(point_ids))],
+        )
+        async with semaphore:
+            if chunk_store is None and lexical_index is None:
+                await client.delete(collection_name="fda_drugs", points_selector=models.FilterSelector(filter=stale_filter))
+                return
+            # The chunk store and lexical index are keyed by point ID, so look the stale points up before deleting them
+            stale_ids = []
+            offset = None
+            while True:
+                records, offset = await client.scroll(collection_name="fda_drugs", scroll_filter=stale_filter, limit=256,
+                                                      offset=offset, with_payload=False, with_vectors=False)
+                stale_ids += [record.id for record in records]
+                if offset is None:
+                    break
+            if stale_ids:
+                await client.delete(collection_name="fda_drugs", points_selector=models.PointIdsList(points=stale_ids))
+                if chunk_store is not None:
+                    await asyncio.to_thread(chunk_store.delete_many, stale_ids)
+                if lexical_index is not None:
+                    await asyncio.to_thread(lexical_index.delete_many, stale_ids)
+
+    await asyncio.gather(*(delete_label(spl_id, point_ids) for spl_id, point_ids in label_point_ids.items()))
+
+async def delete_removed_labels(current_labels, batch_size=1024):
+    """Delete points none of whose labels are in `current_labels`; returns how many were deleted."""
+    removed_ids = []
+    offset = None
+    while True:
+        records, offset = await client.scroll(collection_name="fda_drugs", limit=batch_size, offset=offset,
+                                              with_payload=["spl_id"], with_vectors=False)
+        # Points without an spl_id field were not written by this indexer, so they are left alone
+        removed_ids += [record.id for record in records
+                        if "spl_id" in (record.payload or {}) and current_labels.isdisjoint(record.payload["spl_id"])]
+        if offset is None:
+            break
+    for i in range(0, len(removed_ids), batch_size):
+        batch = removed_ids[i:i + batch_size]
+        await client.delete(collection_name="fda_drugs", points_selector=models.PointIdsList(points=batch))
+        if chunk_store is not None:
+            await asyncio.to_thread(chunk_store.delete_many, batch)
+        if lexical_index is not None:
+            await asyncio.to_thread(lexical_index.delete_many, batch)
+    return len(removed_ids)
+
+def record_stage_time(job, stage, seconds):
+    STAGE_SECONDS.labels(stage).observe(seconds)
+    if job is not None:
+        job.add_stage_time(stage, seconds)
 
-@app.post("/index_fda_drugs")
-async def index_fda_drugs(url: str = Query(..., description="URL of the ZIP file to index")):
+async def index_documents(split_drug_docs, label="", job=None, checkpoint_key=None, bulk_load=False):
+    """Embed and upsert chunks from an iterable; returns (indexed, total).
+
+    Runs a split -> embed -> upsert pipeline connected by bounded queues, so
+    embedding of one batch overlaps the upsert of the previous one and at most
+    PIPELINE_QUEUE_SIZE batches wait between stages. Chunks are pulled from
+    `split_drug_docs` in a worker thread so parsing does not block the event
+    loop. Progress is recorded on `job` if one is given.
+
+    With `checkpoint_key` = (source, version), every fully committed batch is
+    recorded in the checkpoint, and batches committed by an earlier run of the
+    same version are skipped without embedding or upserting, as long as they
+    hold the same chunks (same count, first and last point ID).
+
+    With `bulk_load`, the upsert stage feeds a single upload_points call that
+    streams every batch to Qdrant without waiting for each to be applied.
+    Batches are then checkpointed only once the whole upload has succeeded.
+    """
+    upsert_workers = 1 if bulk_load else UPSERT_WORKERS
+    embed_queue = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    upsert_queue = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    total_docs = 0
+    indexed_count = 0
+    # Committed point IDs per label, and labels with chunks that failed to index
+    label_point_ids = {}
+    incomplete_labels = set()
+    index_start_time = time.time()
+    committed_batches = checkpoint.committed_batches(*checkpoint_key) if checkpoint_key else set()
+    if committed_batches:
+        print(f"{label}Resuming: {len(committed_batches)} batches were committed by an earlier run")
+
+    def record_batch(batch_docs, committed_ids):
+        nonlocal indexed_count
+        indexed_count += len(committed_ids)
+        CHUNKS_INDEXED.inc(len(committed_ids))
+        if job is not None:
+            job.processed += len(batch_docs)
+            job.indexed += len(committed_ids)
+        for doc in batch_docs:
+            point_id = chunk_point_id(doc)
+            for spl_id in covered_spl_ids(doc):
+                if point_id in committed_ids:
+                    label_point_ids.setdefault(spl_id, set()).add(point_id)
+                else:
+                    incomplete_labels.add(spl_id)
+
+    async def split_stage():
+        nonlocal total_docs
+        for batch_index in itertools.count():
+            stage_start = time.perf_counter()
+            batch_docs = await asyncio.to_thread(lambda: list(itertools.islice(split_drug_docs, INDEX_BATCH_SIZE)))
+            record_stage_time(job, "parse and split", time.perf_counter() - stage_start)
+            if not batch_docs:
+                break
+            total_docs += len(batch_docs)
+            if batch_index in committed_batches:
+                assign_content_hashes(batch_docs)
+                point_ids = [chunk_point_id(doc) for doc in batch_docs]
+                if committed_batches[batch_index] == (len(point_ids), point_ids[0], point_ids[-1]):
+                    # Already upserted; only its point IDs are needed for stale-chunk cleanup
+                    record_batch(batch_docs, set(point_ids))
+                    continue
+                print(f"{label}Batch {batch_index} no longer matches the checkpoint; indexing it again")
+            await embed_queue.put((batch_index, batch_docs))
+        for _ in range(EMBED_WORKERS):
+            await embed_queue.put(None)
+
+    async def embed_worker():
+        while True:
+            item = await embed_queue.get()
+            if item is None:
+                break
+            batch_index, batch_docs = item
+            stage_start = time.perf_counter()
+            points, existing_ids = await embed_batch(batch_docs, METADATA_FIELDS)
+            record_stage_time(job, "embed", time.perf_counter() - stage_start)
+            await upsert_queue.put((batch_index, batch_docs, points, existing_ids))
+
+    async def embed_stage():
+        await asyncio.gather(*(embed_worker() for _ in range(EMBED_WORKERS)))
+        for _ in range(upsert_workers):
+            await upsert_queue.put(None)
+
+    async def upsert_worker():
+        while True:
+            item = await upsert_queue.get()
+            if item is None:
+                break
+            batch_index, batch_docs, points, existing_ids = item
+            stage_start = time.perf_counter()
+            committed_ids = set(existing_ids) | set(await upsert_batch(points))
+            record_stage_time(job, "upsert", time.perf_counter() - stage_start)
+            CHUNKS_UPSERTED.inc(len(committed_ids) - len(existing_ids))
+            if job is not None:
+                job.upserted += len(committed_ids) - len(existing_ids)
+            record_batch(batch_docs, committed_ids)
+            if checkpoint_key and len(committed_ids) == len(batch_docs):
+                checkpoint.commit_batch(*checkpoint_key, batch_index, [chunk_point_id(doc) for doc in batch_docs])
+            chunks_per_sec = indexed_count / max(time.time() - index_start_time, 1e-9)
+            print(f"{label}Indexed {indexed_count} / {total_docs} documents ({chunks_per_sec:.1f} chunks/sec)")
+
+    async def bulk_upload_worker():
+        pending = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+        stopped = threading.Event()
+
+        def point_stream():
+            while not stopped.is_set():
+                try:
+                    points = pending.get(timeout=1)
+                except queue.Empty:
+                    continue
+                if points is None:
+                    return
+                yield from points
+
+        upload = asyncio.ensure_future(asyncio.to_thread(
+            bulk_client.upload_points, collection_name="fda_drugs", points=point_stream(),
+            batch_size=BULK_UPLOAD_BATCH_SIZE, parallel=BULK_UPLOAD_PARALLEL, wait=False,
+            # Forking from this threaded, event-loop process can copy a held lock into the children
+            method="forkserver"))
+
+        async def hand_off(points):
+            while True:
+                try:
+                    return await asyncio.to_thread(pending.put, points, timeout=1)
+                except queue.Full:
+                    if upload.done():
+                        # The upload stopped early; surface its error
+                        await upload
+
+        uploaded_batches = []
+        try:
+            while True:
+                item = await upsert_queue.get()
+                if item is None:
+                    break
+                batch_index, batch_docs, points, existing_ids = item
+                stage_start = time.perf_counter()
+                await hand_off(points)
+                committed_ids = set(existing_ids) | {point.id for point in points}
+                record_stage_time(job, "upsert", time.perf_counter() - stage_start)
+                CHUNKS_UPSERTED.inc(len(points))
+                if job is not None:
+                    job.upserted += len(points)
+                record_batch(batch_docs, committed_ids)
+                if len(committed_ids) == len(batch_docs):
+                    uploaded_batches.append((batch_index, [chunk_point_id(doc) for doc in batch_docs]))
+                chunks_per_sec = indexed_count / max(time.time() - index_start_time, 1e-9)
+                print(f"{label}Uploading {indexed_count} / {total_docs} documents ({chunks_per_sec:.1f} chunks/sec)")
+
+            stage_start = time.perf_counter()
+            await hand_off(None)
+            await upload
+            record_stage_time(job, "upsert", time.perf_counter() - stage_start)
+        finally:
+            stopped.set()
+        if checkpoint_key:
+            for batch_index, point_ids in uploaded_batches:
+                checkpoint.commit_batch(*checkpoint_key, batch_index, point_ids)
+
+    stages = [asyncio.create_task(split_stage()), asyncio.create_task(embed_stage())]
+    if bulk_load:
+        stages.append(asyncio.create_task(bulk_upload_worker()))
+    else:
+        stages += [asyncio.create_task(upsert_worker()) for _ in range(UPSERT_WORKERS)]
+    active_pipelines.append((embed_queue, upsert_queue))
     try:
-        start_time = time.time()  # Start timing
-
-        # Create or recreate the collection
-        await create_collection()
-        
-        # Download and load data
-        response = requests.get(url)
-        zip_file = zipfile.ZipFile(io.BytesIO(response.content))
-        json_file = zip_file.open(zip_file.namelist()[0])
-        data = json.load(json_file)
-        df = pd.json_normalize(data['results'])
-        selected_drugs = df
-        
-        # Define metadata fields to include
-        metadata_fields = ['openfda.brand_name', 'openfda.generic_name', 'openfda.manufacturer_name', 'openfda.product_type',
-                        'openfda.route', 'openfda.substance_name', 'openfda.rxcui', 'openfda.spl_id', 'openfda.package_ndc']
-        
-        # Fill NaN values with empty strings
-        selected_drugs[metadata_fields] = selected_drugs[metadata_fields].fillna('')
-        
-        # Define text fields to index
-        text_fields = ['description', 'indications_and_usage', 'contraindications', 'warnings', 'adverse_reactions', 'dosage_and_administration']
-        
-        # Fill NaN values with empty strings and concatenate text fields
-        selected_drugs[text_fields] = selected_drugs[text_fields].fillna('')
-        selected_drugs['page_content'] = selected_drugs[text_fields].apply(lambda x: ' '.join(x.astype(str)), axis=1)
-        
-        # Create document loader and load drug documents
-        loader = DataFrameLoader(selected_drugs, page_content_column='page_content')
-        drug_docs = loader.load()
-        
-        # Update metadata for each document
-        for doc, row in zip(drug_docs, selected_drugs.to_dict(orient='records')):
-            metadata = {}
-            for field in metadata_fields:
-                value = row.get(field)
-                if isinstance(value, list):
-                    value = ', '.join(str(v) for v in value if pd.notna(v))
-                elif pd.isna(value):
-                    value = 'Not Available'
-                metadata[field] = value
-            doc.metadata = metadata
-        
-        # Split drug documents into chunks
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
-        split_drug_docs = text_splitter.split_documents(drug_docs)
-        total_docs = len(split_drug_docs)  # Get the total number of split documents
-        
-        # Index documents in batches
-        batch_size = 100
-        indexed_count = 0
-        for i in range(0, total_docs, batch_size):
-            batch_docs = split_drug_docs[i:i+batch_size]
-            batch_count = await index_batch(batch_docs, metadata_fields)
-            indexed_count += batch_count
-            print(f"Indexed {indexed_count} / {total_docs} documents")
-        
-        remaining = total_docs - indexed_count
-        print(f"Indexing completed. Indexed {indexed_count} / {total_docs}, Remaining: {remaining}")
-        
-        end_time = time.time()  # End timing
-        total_time = end_time - start_time
-        print(f"Total time taken to index: {total_time:.2f} seconds")
-        
-        return {"message": "Indexing completed"}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        await asyncio.gather(*stages)
+    finally:
+        # On failure or cancellation, stop the remaining stages instead of leaving them blocked on a queue
+        for stage in stages:
+            stage.cancel()
+        active_pipelines.remove((embed_queue, upsert_queue))
+
+    # Remove chunks left over from earlier versions of labels that were fully re-indexed
+    if job is not None:
+        job.stage = "deleting stale chunks"
+    for spl_id in incomplete_labels | {'', 'Not Available'}:
+        label_point_ids.pop(spl_id, None)
+    stage_start = time.perf_counter()
+    await delete_stale_chunks(label_point_ids)
+    record_stage_time(job, "delete stale", time.perf_counter() - stage_start)
+    return indexed_count, total_docs
+
+async def run_index_partition(job, url, resume=True, bulk_load=False):
+    start_time = time.time()  # Start timing
+    if not resume:
+        checkpoint.reset(url)
+
+    # Create or recreate the collection
+    job.stage = "creating collection"
+    await create_collection()
+    
+    # Fetch the archive into the download cache (unless unchanged) and read labels one at a time
+    job.stage = "downloading"
+    stage_start = time.perf_counter()
+    zip_path, archive_version = await asyncio.to_thread(download_cache.fetch, url)
+    record_stage_time(job, "download", time.perf_counter() - stage_start)
+    # Checkpoints are only reused for byte-identical archives split with the same settings
+    version = f"{archive_version}:{pipeline_fingerprint()}"
+    if checkpoint.is_complete(url, version):
+        print(f"{url} (version {version[:12]}) is already fully indexed. Skipping.")
+        return
+
+    # Until parsing finishes, estimate the chunk total from how much of the archive has been read
+    def on_progress(bytes_read, total_bytes):
+        if bytes_read:
+            job.expected_total = int(job.processed * total_bytes / bytes_read)
+
+    # Split each label into section-aligned chunks as it is read. Deduplication
+    # reads the archive twice: once to group duplicates, once to index them
+    chunker = SectionChunker()
+    if DEDUPLICATE_CHUNKS:
+        passes = iter([None, on_progress])
+        make_chunks = lambda: iter_label_chunks(iter_label_sections(zip_path, next(passes)), chunker)
+        split_drug_docs = deduplicate_chunks(make_chunks, NEAR_DUPLICATE_THRESHOLD)
+    else:
+        split_drug_docs = iter_label_chunks(iter_label_sections(zip_path, on_progress), chunker)
+    
+    job.stage = "indexing"
+    index_start_time = time.time()
+    if bulk_load:
+        await begin_bulk_load()
+    loaded = False
+    try:
+        indexed_count, total_docs = await index_documents(split_drug_docs, job=job, checkpoint_key=(url, version),
+                                                          bulk_load=bulk_load)
+        loaded = True
+    finally:
+        if bulk_load:
+            # Build the HNSW index once over everything loaded; only wait for it after a successful load
+            await end_bulk_load(job if loaded else None)
+    job.expected_total = total_docs
+    if indexed_count == total_docs:
+        checkpoint.mark_complete(url, version)
+    
+    remaining = total_docs - indexed_count
+    print(f"Indexing completed. Indexed {indexed_count} / {total_docs}, Remaining: {remaining}")
+    
+    end_time = time.time()  # End timing
+    total_time = end_time - start_time
+    index_time = end_time - index_start_time
+    print(f"Total time taken to index: {total_time:.2f} seconds")
+    print(f"Embedding and upsert throughput: {indexed_count / max(index_time, 1e-9):.1f} chunks/sec")
+
+async def run_index_all_partitions(job, max_workers, resume=True, bulk_load=False):
+    start_time = time.time()  # Start timing
+
+    job.stage = "creating collection"
+    await create_collection()
+    export_date, all_urls = await asyncio.to_thread(fetch_partition_manifest)
+    version = f"{export_date}:{pipeline_fingerprint()}"
+    if not resume:
+        for url in all_urls:
+            checkpoint.reset(url)
+    # Partitions already indexed for this export date are not downloaded again
+    urls = [url for url in all_urls if not checkpoint.is_complete(url, version)]
+    job.partitions_total = len(urls)
+    print(f"Found {len(all_urls)} drug label partitions exported {export_date}, {len(urls)} left to index")
+
+    # Partitions are downloaded, parsed and split in worker processes; the
+    # event loop embeds and upserts each partition as soon as it is ready
+    job.stage = "indexing"
+    loop = asyncio.get_running_loop()
+    indexed_count = 0
+    total_docs = 0
+    split_chunks = 0
+    # Forking this threaded event-loop process could copy a lock held by another thread into the workers
+    pool = ProcessPoolExecutor(max_workers=max_workers or os.cpu_count(),
+                               mp_context=multiprocessing.get_context("forkserver"))
+    if bulk_load:
+        await begin_bulk_load()
+    loaded = False
+    try:
+        with tempfile.TemporaryDirectory() as spool_dir:
+            futures = [loop.run_in_executor(pool, split_partition, url, spool_dir, DEDUPLICATE_CHUNKS, NEAR_DUPLICATE_THRESHOLD)
+                       for url in urls]
+            for completed, future in enumerate(asyncio.as_completed(futures), 1):
+                url, spool_path, chunk_count, split_time = await future
+                name = url.rsplit('/', 1)[-1]
+                print(f"[{completed}/{len(urls)}] {name}: {chunk_count} chunks split in {split_time:.2f} seconds")
+                record_stage_time(job, "download, parse and split", split_time)
+
+                # Extrapolate the job total from the partitions split so far
+                split_chunks += chunk_count
+                job.expected_total = int(split_chunks * len(urls) / completed)
+
+                partition_labels = set()
+                partition_docs = collect_spl_ids(iter_spooled_documents(spool_path), partition_labels)
+                partition_indexed, partition_total = await index_documents(partition_docs, label=f"{name}: ",
+                                                                           job=job, checkpoint_key=(url, version),
+                                                                           bulk_load=bulk_load)
+                job.stage = "indexing"
+                os.remove(spool_path)
+                if partition_indexed == partition_total:
+                    checkpoint.mark_complete(url, version, partition_labels)
+                indexed_count += partition_indexed
+                total_docs += partition_total
+                job.partitions_done = completed
+
+                elapsed = time.time() - start_time
+                print(f"[{completed}/{len(urls)}] {name} done. Total indexed {indexed_count} / {total_docs} "
+                      f"({indexed_count / max(elapsed, 1e-9):.1f} chunks/sec)")
+        loaded = True
+    finally:
+        # Do not block the event loop waiting on workers if the job was cancelled
+        pool.shutdown(wait=False, cancel_futures=True)
+        if bulk_load:
+            await end_bulk_load(job if loaded else None)
+
+    # Labels openFDA dropped from this export are in no partition, so nothing above replaced
+    # their points; once every partition of the export is indexed, delete them
+    current_labels = checkpoint.current_labels(all_urls, version)
+    if current_labels:
+        job.stage = "deleting removed labels"
+        stage_start = time.perf_counter()
+        removed = await delete_removed_labels(current_labels)
+        record_stage_time(job, "delete removed labels", time.perf_counter() - stage_start)
+        print(f"Deleted {removed} chunks of labels that are no longer in the {export_date} export")
+
+    total_time = time.time() - start_time
+    print(f"Indexing completed. Indexed {indexed_count} / {total_docs} from {len(urls)} partitions")
+    print(f"Total time taken to index: {total_time:.2f} seconds ({indexed_count / max(total_time, 1e-9):.1f} chunks/sec)")
+
+@app.post("/index_fda_drugs", status_code=202)
+async def index_fda_drugs(url: str = Query(..., description="URL of the ZIP file to index"),
+                          resume: bool = Query(True, description="Skip batches committed by an earlier run of the same file"),
+                          bulk_load: bool = Query(False, description="Bulk upload with HNSW indexing deferred to the end (initial loads)")):
+    job = job_manager.submit("index_fda_drugs", {"url": url, "resume": resume, "bulk_load": bulk_load},
+                             lambda job: run_index_partition(job, url, resume, bulk_load))
+    return {"message": "Indexing started", "job_id": job.id, "status_url": f"/jobs/{job.id}"}
+
+@app.post("/index_fda_drugs_all", status_code=202)
+async def index_fda_drugs_all(max_workers: int = Query(None, description="Worker processes for download, parse and split (default: all cores)"),
+                              resume: bool = Query(True, description="Skip partitions and batches committed by an earlier run"),
+                              bulk_load: bool = Query(False, description="Bulk upload with HNSW indexing deferred to the end (initial loads)")):
+    job = job_manager.submit("index_fda_drugs_all", {"max_workers": max_workers, "resume": resume, "bulk_load": bulk_load},
+                             lambda job: run_index_all_partitions(job, max_workers, resume, bulk_load))
+    return {"message": "Indexing started", "job_id": job.id, "status_url": f"/jobs/{job.id}"}
+
+@app.get("/jobs")
+async def list_jobs():
+    return [job.to_dict() for job in job_manager.jobs.values()]
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job.to_dict()
+
+@app.post("/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    job = job_manager.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job.to_dict()
+
+@app.get("/metrics")
+async def metrics():
+    # Gauges describing the current state are computed at scrape time
+    running = [job for job in job_manager.jobs.values() if job.started_at and not job.finished]
+    RUNNING_JOBS.set(len(running))
+    THROUGHPUT.set(sum(job.to_dict()["chunks_per_sec"] for job in running))
+    QUEUE_DEPTH.labels("embed").set(sum(embed_queue.qsize() for embed_queue, _ in active_pipelines))
+    QUEUE_DEPTH.labels("upsert").set(sum(upsert_queue.qsize() for _, upsert_queue in active_pipelines))
+    if embedding_client is not None:
+        EMBEDDING_CONCURRENCY_LIMIT.set(embedding_client.limiter.limit)
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
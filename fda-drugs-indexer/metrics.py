@@ -0,0 +1,44 @@
+from prometheus_client import Counter, Gauge, Histogram
+
+# Exposed in Prometheus text format at GET /metrics
+
+STAGE_SECONDS = Histogram(
+    "fda_indexer_stage_seconds",
+    "Time spent per pipeline step: one download, one batch of parse and split, embed or upsert, etc.",
+    ["stage"],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 900, 1800),
+)
+
+EMBEDDING_REQUEST_SECONDS = Histogram(
+    "fda_indexer_embedding_request_seconds",
+    "Latency of requests to the embeddings API, by outcome (ok, throttled, error)",
+    ["outcome"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60),
+)
+
+EMBEDDING_BATCH_SIZE = Histogram(
+    "fda_indexer_embedding_batch_size",
+    "Texts per embeddings request",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 2048),
+)
+
+EMBEDDING_RETRIES = Counter("fda_indexer_embedding_retries_total", "Embedding requests retried after a failure")
+
+CHUNKS_INDEXED = Counter("fda_indexer_chunks_indexed_total", "Chunks committed to Qdrant, including ones already present")
+
+CHUNKS_UPSERTED = Counter("fda_indexer_chunks_upserted_total", "Chunks written to Qdrant")
+
+CHUNKS_FAILED = Counter(
+    "fda_indexer_chunks_failed_total",
+    "Chunks dropped from a run, by the step that failed (embed, upsert)",
+    ["reason"],
+)
+
+QUEUE_DEPTH = Gauge("fda_indexer_queue_depth", "Batches waiting between pipeline stages", ["queue"])
+
+EMBEDDING_CONCURRENCY_LIMIT = Gauge(
+    "fda_indexer_embedding_concurrency_limit", "Current adaptive limit on embedding requests in flight")
+
+THROUGHPUT = Gauge("fda_indexer_throughput_chunks_per_second", "Chunks indexed per second by the running jobs")
+
+RUNNING_JOBS = Gauge("fda_indexer_running_jobs", "Ingestion jobs currently running")
@@ -0,0 +1,54 @@
+import json
+import os
+import tempfile
+import time
+import requests
+from langchain.docstore.document import Document
+from fda_labels import SectionChunker, iter_label_sections, iter_label_chunks
+from downloads import DownloadCache
+from dedup import deduplicate_chunks
+
+# openFDA publishes the list of downloadable partitions for every endpoint here
+DOWNLOAD_MANIFEST_URL = "https://api.fda.gov/download.json"
+
+
+def fetch_partition_manifest(manifest_url=DOWNLOAD_MANIFEST_URL):
+    """Return (export_date, partition URLs) for the drug-label dataset in the openFDA manifest.
+
+    The export date changes whenever openFDA republishes the dataset, so it
+    serves as the content version of every partition.
+    """
+    response = requests.get(manifest_url, timeout=60)
+    response.raise_for_status()
+    label_dataset = response.json()['results']['drug']['label']
+    return label_dataset['export_date'], [partition['file'] for partition in label_dataset['partitions']]
+
+
+def split_partition(url, spool_dir, deduplicate=True, near_duplicate_threshold=0.9):
+    """Download, parse, split and deduplicate one partition, spooling its chunks to disk.
+
+    Runs in a worker process, so several partitions download in parallel into
+    the shared download cache. Chunks are written as JSON lines to a file in
+    `spool_dir` so they never have to be held in memory or pickled back to the
+    parent; returns (url, spool_path, chunk_count, seconds).
+    """
+    start_time = time.time()
+    chunker = SectionChunker()
+    fd, spool_path = tempfile.mkstemp(suffix='.jsonl', dir=spool_dir)
+
+    chunk_count = 0
+    zip_path, _ = DownloadCache().fetch(url)
+    with os.fdopen(fd, 'w') as spool_file:
+        make_chunks = lambda: iter_label_chunks(iter_label_sections(zip_path), chunker)
+        chunks = deduplicate_chunks(make_chunks, near_duplicate_threshold) if deduplicate else make_chunks()
+        for chunk in chunks:
+            spool_file.write(json.dumps({"page_content": chunk.page_content, "metadata": chunk.metadata}) + '\n')
+            chunk_count += 1
+    return url, spool_path, chunk_count, time.time() - start_time
+
+
+def iter_spooled_documents(spool_path):
+    """Yield the chunks written by split_partition as Documents."""
+    with open(spool_path) as spool_file:
+        for line in spool_file:
+            yield Document(**json.loads(line))
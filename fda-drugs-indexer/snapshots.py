@@ -0,0 +1,125 @@
+# Build-once snapshots of the fda_drugs collection, so a new deployment serves
+# the index without downloading and embedding the labels again.
+#
+# After indexing (see main.py), save the collection to a file:
+# python snapshots.py create fda_drugs.snapshot
+#
+# Restore it into a Qdrant that does not have it yet, e.g. a local
+# `docker run -p 6333:6333 qdrant/qdrant`, in seconds:
+# python snapshots.py restore fda_drugs.snapshot
+#
+# The Streamlit app restores COLLECTION_SNAPSHOT by itself when the collection
+# is missing. It can be a local path, which is uploaded, or an http(s) URL that
+# the Qdrant server downloads directly.
+#
+# With CHUNK_STORE_PATH set, chunk text lives in the chunk store rather than
+# the snapshot, so ship that file alongside it.
+
+import argparse
+import hashlib
+import os
+import time
+import httpx
+from dotenv import load_dotenv
+from qdrant_client import QdrantClient
+from qdrant_client.http import models
+
+COLLECTION_SNAPSHOT = os.getenv("COLLECTION_SNAPSHOT")
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def _snapshots_url(client, collection_name):
+    # The REST address the client resolved, including its default port
+    return f"{client.http.client.host}/collections/{collection_name}/snapshots"
+
+
+def _headers(api_key):
+    return {"api-key": api_key} if api_key else {}
+
+
+def create_snapshot_file(client, path, collection_name="fda_drugs", api_key=None,
+                         chunk_size=1024 * 1024, timeout=600):
+    """Snapshot `collection_name` on the server and download it to `path`.
+
+    The SHA-256 of the file is written next to it as `<path>.sha256`, so the
+    server can verify the upload on restore. Returns the SHA-256.
+    """
+    snapshot = client.create_snapshot(collection_name, wait=True)
+    part_path = path + ".part"
+    digest = hashlib.sha256()
+    try:
+        with httpx.stream("GET", f"{_snapshots_url(client, collection_name)}/{snapshot.name}",
+                          headers=_headers(api_key), timeout=timeout) as response:
+            response.raise_for_status()
+            with open(part_path, "wb") as f:
+                for chunk in response.iter_bytes(chunk_size):
+                    f.write(chunk)
+                    digest.update(chunk)
+    finally:
+        # The server keeps its own copy until deleted
+        client.delete_snapshot(collection_name, snapshot.name, wait=True)
+
+    if snapshot.checksum and snapshot.checksum != digest.hexdigest():
+        os.remove(part_path)
+        raise SnapshotError(f"Snapshot {snapshot.name} failed verification: "
+                            f"expected sha256 {snapshot.checksum}, got {digest.hexdigest()}")
+    os.replace(part_path, path)
+    with open(path + ".sha256", "w") as f:
+        f.write(digest.hexdigest())
+    return digest.hexdigest()
+
+
+def restore_snapshot(client, location, collection_name="fda_drugs", api_key=None, timeout=600):
+    """Recover `collection_name` from a snapshot file or URL, replacing any data it has."""
+    if location.startswith(("http://", "https://")):
+        client.recover_snapshot(collection_name, location,
+                                priority=models.SnapshotPriority.SNAPSHOT, wait=True)
+        return
+
+    params = {"wait": "true", "priority": models.SnapshotPriority.SNAPSHOT.value}
+    if os.path.exists(location + ".sha256"):
+        with open(location + ".sha256") as f:
+            params["checksum"] = f.read().strip()
+    with open(location, "rb") as f:
+        response = httpx.post(f"{_snapshots_url(client, collection_name)}/upload",
+                              params=params,
+                              files={"snapshot": (os.path.basename(location), f)},
+                              headers=_headers(api_key),
+                              timeout=timeout)
+    if response.status_code >= 400:
+        raise SnapshotError(f"Restoring {location} failed with HTTP {response.status_code}: {response.text}")
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Save or restore the fda_drugs collection as a Qdrant snapshot")
+    parser.add_argument("--qdrant-url", default=os.getenv("QDRANT_CLUSTER_URL"))
+    parser.add_argument("--collection", default="fda_drugs")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    create = subparsers.add_parser("create", help="Download a snapshot of the collection to a file")
+    create.add_argument("path")
+    restore = subparsers.add_parser("restore", help="Recover the collection from a snapshot file or URL")
+    restore.add_argument("location")
+    args = parser.parse_args()
+
+    api_key = os.getenv("QDRANT_API_KEY")
+    client = QdrantClient(url=args.qdrant_url, api_key=api_key)
+    start = time.perf_counter()
+    if args.command == "create":
+        checksum = create_snapshot_file(client, args.path, args.collection, api_key=api_key)
+        size = os.path.getsize(args.path) / 1024 / 1024
+        print(f"Saved {args.collection} to {args.path} ({size:.1f} MB, sha256 {checksum}) "
+              f"in {time.perf_counter() - start:.1f}s")
+        if os.getenv("CHUNK_STORE_PATH"):
+            print(f"Chunk text is in {os.getenv('CHUNK_STORE_PATH')}; deploy it with the snapshot")
+    else:
+        restore_snapshot(client, args.location, args.collection, api_key=api_key)
+        count = client.count(args.collection, exact=True).count
+        print(f"Restored {count} points into {args.collection} in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
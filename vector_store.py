@@ -1,19 +1,358 @@
 import os
-import json
-import requests
-import zipfile
-import io
-import pandas as pd
+import re
+import sys
+import itertools
+import threading
+import time
 from qdrant_client import QdrantClient
 from qdrant_client.http import models
+from langchain.docstore.document import Document
 from langchain.vectorstores import Qdrant
+from langchain_core.vectorstores import VectorStore
 from langchain_openai import OpenAIEmbeddings
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.document_loaders import DataFrameLoader
+
+# Label parsing is shared with the indexer service
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             "fda-drugs-indexer"))
+from fda_labels import SectionChunker, iter_label_sections, iter_label_chunks
+from downloads import DownloadCache
+from embedding_cache import CachedEmbeddings
+from chunk_store import CHUNK_STORE_PATH, ChunkStore
+from lexical_index import LEXICAL_INDEX_PATH, LexicalIndex
+from snapshots import COLLECTION_SNAPSHOT, restore_snapshot
+from local_index import LOCAL_INDEX_PATH, LocalVectorIndex
+from collection import (EMBEDDING_DIMENSIONS, VECTOR_SIZE, VECTORS_ON_DISK, VectorSizeMismatchError,
+                        check_vector_size, collection_search_params, hnsw_config, quantization_config)
+
+# Answer questions naming an indexed drug from the lexical index alone, without embedding them
+LEXICAL_FAST_PATH = os.getenv("LEXICAL_FAST_PATH", "true").lower() == "true"
+
+# Words that are never drug names on their own, so they are not tried as one
+QUESTION_STOPWORDS = {
+    "a", "about", "all", "an", "and", "any", "are", "be", "can", "do", "does", "dose", "dosage", "drug",
+    "drugs", "effect", "effects", "for", "from", "how", "i", "in", "is", "it", "me", "medication",
+    "medicine", "my", "of", "on", "or", "side", "should", "take", "taking", "tell", "the", "to", "what",
+    "when", "which", "who", "why", "with", "you",
+}
+
+
+def drug_name_candidates(question, max_words=4):
+    """Lowercase word n-grams of a question that could be a generic or brand name."""
+    words = re.findall(r"[a-z0-9][a-z0-9\-]*", question.lower())
+    candidates = {}
+    for size in range(1, max_words + 1):
+        for i in range(len(words) - size + 1):
+            ngram = words[i:i + size]
+            if ngram[0] in QUESTION_STOPWORDS or ngram[-1] in QUESTION_STOPWORDS:
+                continue
+            if size == 1 and len(ngram[0]) < 3:
+                continue
+            candidates[" ".join(ngram)] = None
+    return list(candidates)
+
+
+def drug_name_filter(question):
+    """Filter matching points whose generic or brand name appears in `question`, or None."""
+    candidates = drug_name_candidates(question)
+    if not candidates:
+        return None
+    return models.Filter(should=[
+        models.FieldCondition(key="generic_name", match=models.MatchAny(any=candidates)),
+        models.FieldCondition(key="brand_name", match=models.MatchAny(any=candidates)),
+    ])
+
+
+def fill_results(results, fallback, k):
+    """Top up drug-filtered `results` to k with unfiltered `fallback` hits not already in them."""
+    seen = {doc.page_content for doc, _ in results}
+    for doc, score in fallback:
+        if len(results) < k and doc.page_content not in seen:
+            results.append((doc, score))
+    return results
+
+
+def reciprocal_rank_fusion(result_lists, k, rrf_k=60):
+    """Merge ranked [(doc, score)] lists by summing 1 / (rrf_k + rank) per document."""
+    scores = {}
+    documents = {}
+    for results in result_lists:
+        for rank, (doc, _) in enumerate(results, start=1):
+            documents.setdefault(doc.page_content, doc)
+            scores[doc.page_content] = scores.get(doc.page_content, 0) + 1 / (rrf_k + rank)
+    ranked = sorted(scores, key=scores.get, reverse=True)[:k]
+    return [(documents[key], scores[key]) for key in ranked]
+
+
+def hybrid_search_with_score(query, k, dense_search, lexical_index, lexical_documents, fetch_k=20):
+    """Dense and BM25 results for `query`, fused by reciprocal rank.
+
+    If the question names an indexed drug and BM25 over that drug's chunks
+    alone finds k of them, those are returned with their BM25 scores and the
+    question is never embedded.
+    """
+    names = lexical_index.known_names(drug_name_candidates(query))
+    if names and LEXICAL_FAST_PATH:
+        hits = lexical_index.search(query, k, names=names)
+        if len(hits) >= k:
+            return lexical_documents(hits)
+    fetch_k = max(k, fetch_k)
+    return reciprocal_rank_fusion([dense_search(query, fetch_k),
+                                   lexical_documents(lexical_index.search(query, fetch_k))], k)
+
+
+class FDADrugsQdrant(Qdrant):
+    """Qdrant vector store that searches with the collection's default search params.
+
+    For quantized collections these rescore oversampled candidates with the
+    original vectors, so callers get full-precision ranking without asking.
+
+    A query that names a drug is first searched within that drug's labels, via
+    the keyword-indexed generic_name/brand_name payload fields, so unrelated
+    labels cannot crowd out the top-k. If that finds fewer than k chunks (no
+    drug named, or a name that is not indexed) the rest come from an
+    unfiltered search. Set `drug_name_prefilter` only if the collection has
+    those fields (collections built by Qdrant.from_documents do not), since
+    otherwise every such query costs a second, unfiltered search.
+
+    With a `chunk_store`, points carry only filter fields and the text and
+    metadata of all hits are read from the store in one lookup.
+
+    With a `lexical_index` built by the indexer, unfiltered searches are
+    hybrid: see hybrid_search_with_score.
+    """
+
+    def __init__(self, *args, default_search_params=None, chunk_store=None, lexical_index=None,
+                 drug_name_prefilter=False, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.default_search_params = default_search_params
+        self.drug_name_prefilter = drug_name_prefilter
+        self.chunk_store = chunk_store
+        self.lexical_index = lexical_index
+
+    def _stored_document(self, point_id, page_content, metadata):
+        metadata["_id"] = point_id
+        metadata["_collection_name"] = self.collection_name
+        return Document(page_content=page_content, metadata=metadata)
+
+    def similarity_search_with_score_by_vector(self, embedding, k=4, filter=None,
+                                               search_params=None, offset=0,
+                                               score_threshold=None,
+                                               consistency=None, **kwargs):
+        search_params = search_params or self.default_search_params
+        if self.chunk_store is None:
+            return super().similarity_search_with_score_by_vector(
+                embedding,
+                k,
+                filter=filter,
+                search_params=search_params,
+                offset=offset,
+                score_threshold=score_threshold,
+                consistency=consistency,
+                **kwargs)
+
+        results = self.client.search(collection_name=self.collection_name,
+                                     query_vector=embedding,
+                                     query_filter=filter,
+                                     search_params=search_params,
+                                     limit=k,
+                                     offset=offset,
+                                     with_payload=True,
+                                     with_vectors=False,
+                                     score_threshold=score_threshold,
+                                     consistency=consistency,
+                                     **kwargs)
+        stored = self.chunk_store.get_many([result.id for result in results])
+        documents = []
+        for result in results:
+            if str(result.id) in stored:
+                doc = self._stored_document(result.id, *stored[str(result.id)])
+            else:
+                # Points indexed before the chunk store was enabled still carry their text
+                doc = self._document_from_scored_point(
+                    result, self.collection_name, self.content_payload_key,
+                    self.metadata_payload_key)
+            documents.append((doc, result.score))
+        return documents
+
+    def _lexical_documents(self, hits):
+        """[(doc, BM25 score)] for lexical hits, from the chunk store or else the points' payloads."""
+        ids = [point_id for point_id, _ in hits]
+        stored = self.chunk_store.get_many(ids) if self.chunk_store is not None else {}
+        missing = [point_id for point_id in ids if point_id not in stored]
+        records = {}
+        if missing:
+            records = {str(record.id): record for record in self.client.retrieve(
+                self.collection_name, missing, with_payload=True, with_vectors=False)}
+        documents = []
+        for point_id, score in hits:
+            if point_id in stored:
+                documents.append((self._stored_document(point_id, *stored[point_id]), score))
+            elif point_id in records:
+                documents.append((self._document_from_scored_point(
+                    records[point_id], self.collection_name, self.content_payload_key,
+                    self.metadata_payload_key), score))
+        return documents
+
+    def similarity_search_with_score(self, query, k=4, filter=None, **kwargs):
+        if filter is None and self.lexical_index is not None:
+            return hybrid_search_with_score(
+                query, k, lambda query, k: self._dense_search_with_score(query, k, **kwargs),
+                self.lexical_index, self._lexical_documents)
+        return self._dense_search_with_score(query, k, filter=filter, **kwargs)
+
+    def _dense_search_with_score(self, query, k, filter=None, **kwargs):
+        # Embedded once, so the fallback search neither embeds nor counts the question again
+        embedding = self._embed_query(query)
+        drug_filter = drug_name_filter(query) if filter is None and self.drug_name_prefilter else None
+        if drug_filter is None:
+            return self.similarity_search_with_score_by_vector(embedding, k, filter=filter, **kwargs)
+
+        results = self.similarity_search_with_score_by_vector(embedding, k, filter=drug_filter, **kwargs)
+        if len(results) < k:
+            results = fill_results(results, self.similarity_search_with_score_by_vector(embedding, k, **kwargs), k)
+        return results
+
+
+class FDADrugsLocal(VectorStore):
+    """FDADrugsQdrant's search interface over a LocalVectorIndex in this process.
+
+    Search is a matrix product over memory-mapped vectors (or the closest IVF
+    lists), so there is no network round trip. `filter` is a
+    {field: [values]} dict matching any of the values, and questions naming a
+    drug are searched within its labels first, as with FDADrugsQdrant.
+    Unfiltered searches are hybrid with the index's own lexical index.
+    """
+
+    def __init__(self, index, embeddings):
+        self.index = index
+        self._embeddings = embeddings
+
+    @property
+    def embeddings(self):
+        return self._embeddings
+
+    def _similarity_search_with_relevance_scores(self, query, k=4, **kwargs):
+        # Scores are cosine similarities already, as with Qdrant
+        return self.similarity_search_with_score(query, k, **kwargs)
+
+    def add_texts(self, texts, metadatas=None, **kwargs):
+        texts = list(texts)
+        metadatas = metadatas or [{} for _ in texts]
+        rows = self.index.add(self._embeddings.embed_documents(texts), list(zip(texts, metadatas)))
+        self.index.flush()
+        return [str(row) for row in rows]
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, path=LOCAL_INDEX_PATH, **kwargs):
+        store = cls(LocalVectorIndex(path), embedding)
+        store.add_texts(texts, metadatas)
+        return store
+
+    def similarity_search_with_score_by_vector(self, embedding, k=4, filter=None, **kwargs):
+        rows = self.index.rows_matching(filter) if filter else None
+        if rows is not None and len(rows) == 0:
+            return []
+        scores, found = self.index.search(embedding, k, rows=rows)
+        documents = self.index.documents(found[0].tolist())
+        return [(Document(page_content=page_content, metadata=metadata), float(score))
+                for (page_content, metadata), score in zip(documents, scores[0])]
+
+    def similarity_search_by_vector(self, embedding, k=4, filter=None, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k, filter=filter)]
+
+    def _lexical_documents(self, hits):
+        rows = [int(row) for row, _ in hits]
+        return [(Document(page_content=page_content, metadata=metadata), score)
+                for (page_content, metadata), (_, score) in zip(self.index.documents(rows), hits)]
+
+    def similarity_search_with_score(self, query, k=4, filter=None, **kwargs):
+        if filter is None:
+            return hybrid_search_with_score(query, k, self._dense_search_with_score,
+                                            self.index.lexical_index, self._lexical_documents)
+        return self._dense_search_with_score(query, k, filter=filter)
+
+    def _dense_search_with_score(self, query, k, filter=None):
+        embedding = self._embeddings.embed_query(query)
+        # Indexes exported from collections without name fields have nothing to prefilter on
+        has_names = "generic_name" in self.index.filters or "brand_name" in self.index.filters
+        candidates = drug_name_candidates(query) if filter is None and has_names else None
+        if not candidates:
+            return self.similarity_search_with_score_by_vector(embedding, k, filter=filter)
+
+        results = self.similarity_search_with_score_by_vector(
+            embedding, k, filter={"generic_name": candidates, "brand_name": candidates})
+        if len(results) < k:
+            results = fill_results(results, self.similarity_search_with_score_by_vector(embedding, k), k)
+        return results
+
+    def similarity_search(self, query, k=4, filter=None, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, filter=filter)]
+
+
+class CollectionHealthCheck:
+    """Checks in a background thread that a collection can still be reached.
+
+    The app reads `healthy` and `last_error` instead of calling Qdrant before
+    each question, so a slow or failing check never delays an answer.
+    """
+
+    def __init__(self, client, collection_name="fda_drugs", interval=60):
+        self.client = client
+        self.collection_name = collection_name
+        self.interval = interval
+        self.healthy = True
+        self.last_error = None
+        self.last_checked = None
+        self.latency = None
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+
+    def check(self):
+        start = time.perf_counter()
+        try:
+            self.client.get_collection(self.collection_name)
+        except Exception as e:
+            if self.healthy:
+                print(f"Collection '{self.collection_name}' health check failed: {e}")
+            self.healthy = False
+            self.last_error = str(e)
+        else:
+            if not self.healthy:
+                print(f"Collection '{self.collection_name}' is reachable again")
+            self.healthy = True
+            self.last_error = None
+        self.latency = time.perf_counter() - start
+        self.last_checked = time.time()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self.check()
 
 
 def initialize_vector_store():
-    embedding_model = OpenAIEmbeddings(model="text-embedding-3-small")
+    # Repeated chunks and repeated questions are served from the local cache.
+    # Queries must be embedded at the same size as the indexed chunks
+    embedding_model = CachedEmbeddings(
+        OpenAIEmbeddings(model="text-embedding-3-small",
+                         dimensions=EMBEDDING_DIMENSIONS))
+
+    if LOCAL_INDEX_PATH:
+        # Exported from the collection by local_index.py; no Qdrant needed
+        print(f"Loading local vector index from {LOCAL_INDEX_PATH}...")
+        index = LocalVectorIndex(LOCAL_INDEX_PATH)
+        if index.dimensions != VECTOR_SIZE:
+            raise VectorSizeMismatchError(
+                f"Local index at {LOCAL_INDEX_PATH} holds {index.dimensions}-dimensional vectors but "
+                f"EMBEDDING_DIMENSIONS gives {VECTOR_SIZE}. Set EMBEDDING_DIMENSIONS={index.dimensions}, "
+                f"or export the index again.")
+        return FDADrugsLocal(index, embedding_model)
 
     QDRANT_API_KEY = os.environ.get("QDRANT_API_KEY")
     QDRANT_CLUSTER_URL = os.environ.get("QDRANT_CLUSTER_URL")
@@ -26,61 +365,51 @@ def initialize_vector_store():
         collection.name for collection in collections.collections
     ]
 
-    if "fda_drugs" not in collection_names:
-        print("Collection 'fda_drugs' is not present. Creating...")
+    if "fda_drugs" not in collection_names and COLLECTION_SNAPSHOT:
+        # Built once offline by the indexer, so nothing is embedded here
+        print(f"Collection 'fda_drugs' is not present. Restoring from {COLLECTION_SNAPSHOT}...")
+        restore_snapshot(qdrant_client, COLLECTION_SNAPSHOT, api_key=QDRANT_API_KEY)
+    elif "fda_drugs" not in collection_names:
+        print("Collection 'fda_drugs' is not present. Creating... "
+              "(set COLLECTION_SNAPSHOT to restore a prebuilt snapshot instead)")
 
-        # Download and process FDA drug data
         url = "https://download.open.fda.gov/drug/label/drug-label-0001-of-0012.json.zip"
-        response = requests.get(url)
-        zip_file = zipfile.ZipFile(io.BytesIO(response.content))
-        json_file = zip_file.open(zip_file.namelist()[0])
-        data = json.load(json_file)
-
-        df = pd.json_normalize(data['results'])
-
-        metadata_fields = [
-            'openfda.brand_name', 'openfda.generic_name',
-            'openfda.manufacturer_name', 'openfda.product_type',
-            'openfda.route', 'openfda.substance_name', 'openfda.rxcui',
-            'openfda.spl_id', 'openfda.package_ndc'
-        ]
-
-        text_fields = [
-            'description', 'indications_and_usage', 'contraindications',
-            'warnings', 'adverse_reactions', 'dosage_and_administration'
-        ]
-
-        df[text_fields] = df[text_fields].fillna('')
-        df['content'] = df[text_fields].apply(
-            lambda x: ' '.join(x.astype(str)), axis=1)
-
-        loader = DataFrameLoader(df, page_content_column='content')
-        drug_docs = loader.load()
-
-        for doc, row in zip(drug_docs, df.to_dict(orient='records')):
-            metadata = {}
-            for field in metadata_fields:
-                value = row.get(field)
-                if isinstance(value, list):
-                    value = ', '.join(str(v) for v in value if pd.notna(v))
-                elif pd.isna(value):
-                    value = 'Not Available'
-                metadata[field] = value
-            doc.metadata = metadata
-
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000,
-                                                       chunk_overlap=100)
-        split_drug_docs = text_splitter.split_documents(drug_docs)
-
-        qdrant_vectorstore = Qdrant.from_documents(split_drug_docs,
-                                                   embedding_model,
-                                                   url=QDRANT_CLUSTER_URL,
-                                                   api_key=QDRANT_API_KEY,
-                                                   collection_name="fda_drugs")
+        # Fetched once into the local download cache, then read one label at a time
+        zip_path, _ = DownloadCache().fetch(url)
+        # Chunks stay within one label section and carry its name
+        split_drug_docs = iter_label_chunks(iter_label_sections(zip_path),
+                                            SectionChunker())
+
+        # Add chunks in fixed-size batches so memory stays flat
+        qdrant_vectorstore = None
+        while True:
+            batch_docs = list(itertools.islice(split_drug_docs, 1000))
+            if not batch_docs:
+                break
+            if qdrant_vectorstore is None:
+                qdrant_vectorstore = Qdrant.from_documents(
+                    batch_docs,
+                    embedding_model,
+                    url=QDRANT_CLUSTER_URL,
+                    api_key=QDRANT_API_KEY,
+                    collection_name="fda_drugs",
+                    hnsw_config=hnsw_config(),
+                    quantization_config=quantization_config(),
+                    on_disk=VECTORS_ON_DISK)
+            else:
+                qdrant_vectorstore.add_documents(batch_docs)
     else:
         print("Collection 'fda_drugs' is present. Loading...")
-        qdrant_vectorstore = Qdrant(client=qdrant_client,
-                                    collection_name="fda_drugs",
-                                    embeddings=embedding_model)
 
-    return qdrant_vectorstore
+    collection_info = qdrant_client.get_collection("fda_drugs")
+    check_vector_size(collection_info)
+    return FDADrugsQdrant(
+        client=qdrant_client,
+        collection_name="fda_drugs",
+        embeddings=embedding_model,
+        default_search_params=collection_search_params(collection_info),
+        # Only collections built by the indexer carry the keyword-indexed name fields
+        drug_name_prefilter=all(field in (collection_info.payload_schema or {})
+                                for field in ("generic_name", "brand_name")),
+        chunk_store=ChunkStore(CHUNK_STORE_PATH) if CHUNK_STORE_PATH else None,
+        lexical_index=LexicalIndex(LEXICAL_INDEX_PATH) if LEXICAL_INDEX_PATH else None)